@@ -0,0 +1,173 @@
+"""
+Gemini client 重複使用的 micro-benchmark：每個請求的連線建立成本
+
+模擬 --jobs 個工作，每個工作有 --slices 個切片（每片轉錄 + 摘要兩個請求）再加一次最終摘要，
+以三種方式建立 client，比較總時間、每個請求的平均時間與實際開啟的連線數：
+
+  - per-slice：每個切片建立新的 client 與事件迴圈（舊版 Pool worker 的做法）
+  - per-phase：每個工作的 map / reduce 階段各建立一個 client 與事件迴圈
+  - pooled：  genai_client_pool，每個執行緒一個長駐的事件迴圈與 client，跨工作共用連線
+
+stub server 的延遲設為 0，差異只來自 client 建立、TCP 與 TLS 握手。每建立一個 genai.Client
+都會載入 certifi 的 CA bundle 建立 SSL context，這通常是最大的成本。加上 --tls 時 stub 以
+自簽憑證提供 HTTPS（需要 openssl），SSL_CERT_FILE 指向只有一張憑證的檔案，client 建立變得
+很便宜，此時的差異主要是 TLS 握手。
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/bench_client_pool.py
+    python benchmarks/bench_client_pool.py --tls --slices 30 --jobs 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+def make_self_signed_cert(cert_dir: str) -> tuple:
+    cert_path = os.path.join(cert_dir, "stub.crt")
+    key_path = os.path.join(cert_dir, "stub.key")
+    cmd = [
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+        "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        "-keyout", key_path, "-out", cert_path,
+    ]
+    subprocess.run(cmd, check=True, capture_output=True)
+    return cert_path, key_path
+
+
+def stub_connections(stats_url: str, context) -> int:
+    """stub server 至今看過的用戶端連線數"""
+    with urllib.request.urlopen(stats_url, context=context) as resp:
+        return json.load(resp)["connections"]
+
+
+async def generate(backend, client, contents, request_type: str):
+    def call():
+        return client.aio.models.generate_content(model=backend.GEMINI_MODEL, contents=contents)
+    await backend.api_call_with_retry_async(call, model=backend.GEMINI_MODEL, request_type=request_type)
+
+
+async def run_slice(backend, client, index: int):
+    """一個切片的請求：轉錄（inline 音訊）+ 摘要"""
+    from google.genai import types
+    audio = types.Part.from_bytes(data=b"\x00" * 1024, mime_type="audio/mp3")
+    await generate(backend, client, [backend.TRANSCRIBE_PROMPT, audio], "transcribe")
+    await generate(backend, client, [f"切片 {index} 摘要"], "summarize")
+
+
+async def run_map(backend, client, slices: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+            await run_slice(backend, client, i)
+
+    await asyncio.gather(*(bounded(i) for i in range(slices)))
+
+
+async def run_reduce(backend, client):
+    await generate(backend, client, ["最終摘要"], "summarize")
+
+
+def job_per_slice(backend, slices: int, concurrency: int):
+    for i in range(slices):
+        asyncio.run(run_slice(backend, backend.new_genai_client(), i))
+    asyncio.run(run_reduce(backend, backend.new_genai_client()))
+
+
+def job_per_phase(backend, slices: int, concurrency: int):
+    async def map_phase():
+        await run_map(backend, backend.new_genai_client(), slices, concurrency)
+
+    async def reduce_phase():
+        await run_reduce(backend, backend.new_genai_client())
+
+    asyncio.run(map_phase())
+    asyncio.run(reduce_phase())
+
+
+def job_pooled(backend, slices: int, concurrency: int):
+    async def map_phase():
+        await run_map(backend, backend.create_genai_client(), slices, concurrency)
+
+    async def reduce_phase():
+        await run_reduce(backend, backend.create_genai_client())
+
+    backend.run_async(map_phase())
+    backend.run_async(reduce_phase())
+
+
+MODES = {"per-slice": job_per_slice, "per-phase": job_per_phase, "pooled": job_pooled}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini client 重複使用 micro-benchmark")
+    parser.add_argument("--slices", type=int, default=30)
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--tls", action="store_true", help="stub 以自簽憑證提供 HTTPS")
+    args = parser.parse_args()
+    args.upload_latency = args.activation_delay = args.generate_latency = 0.0
+
+    cert_dir = tempfile.mkdtemp(prefix="bench_client_pool_")
+    extra_args = []
+    scheme = "http"
+    if args.tls:
+        cert_path, key_path = make_self_signed_cert(cert_dir)
+        extra_args = ["--ssl-certfile", cert_path, "--ssl-keyfile", key_path]
+        os.environ["SSL_CERT_FILE"] = cert_path
+        scheme = "https"
+
+    base_url = f"{scheme}://127.0.0.1:{args.port}"
+    os.environ["GEMINI_BASE_URL"] = base_url
+    os.environ["GEMINI_API_KEY"] = "stub"
+    os.environ["MODEL_RPM_LIMITS"] = "gemini-2.5-flash=100000"
+    os.environ["REQUEST_TYPE_RPM_LIMITS"] = "upload=100000,transcribe=100000,summarize=100000"
+
+    import ssl
+    import main as backend
+    from bench_map_stage import start_stub_server
+
+    stub = start_stub_server(args.port, args, extra_args)
+    context = ssl.create_default_context(cafile=os.environ.get("SSL_CERT_FILE")) if args.tls else None
+    stats_url = f"{base_url}/stats"
+    try:
+        # 預熱：import 與第一次建立 SSL context 的成本不計入任何一種方式
+        job_per_phase(backend, 1, 1)
+
+        requests = args.jobs * (args.slices * 2 + 1)
+        rows = []
+        for mode, job in MODES.items():
+            before = stub_connections(stats_url, context)
+            start = time.perf_counter()
+            for _ in range(args.jobs):
+                job(backend, args.slices, args.concurrency)
+            elapsed = time.perf_counter() - start
+            rows.append((mode, elapsed, stub_connections(stats_url, context) - before))
+
+        pooled_seconds = rows[-1][1]
+        print(f"\n{args.jobs} 個工作 × {args.slices} 個切片，共 {requests} 個請求（{scheme}）")
+        print(f"{'mode':>10} {'seconds':>9} {'ms/request':>11} {'connections':>12} {'overhead ms/request':>20}")
+        for mode, elapsed, connections in rows:
+            print(
+                f"{mode:>10} {elapsed:>9.2f} {elapsed / requests * 1000:>11.2f} {connections:>12} "
+                f"{(elapsed - pooled_seconds) / requests * 1000:>20.2f}"
+            )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
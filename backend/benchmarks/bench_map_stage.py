@@ -0,0 +1,125 @@
+"""
+Map 階段吞吐量比較：舊的 multiprocessing.Pool(2) vs asyncio 引擎
+
+以本地 stub server（benchmarks/stub_gemini.py）取代 Gemini API，把一個合成的
+長音檔切片後，分別用兩種引擎跑完所有切片的上傳 / 轉錄 / 摘要。
+速率額度在此放寬，比較的是執行引擎本身的並行能力。
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/bench_map_stage.py
+    python benchmarks/bench_map_stage.py --minutes 120 --concurrency 2 16 64 --generate-latency 3
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+def start_stub_server(port: int, args, extra_args=()) -> subprocess.Popen:
+    cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "stub_gemini.py"),
+        "--port", str(port),
+        "--upload-latency", str(args.upload_latency),
+        "--activation-delay", str(args.activation_delay),
+        "--generate-latency", str(args.generate_latency),
+    ]
+    # 錯誤注入參數只有部分效能測試提供
+    for field in ("error_rate_429", "error_rate_503", "retry_delay"):
+        if hasattr(args, field):
+            cmd += [f"--{field.replace('_', '-')}", str(getattr(args, field))]
+    cmd += list(extra_args)
+    proc = subprocess.Popen(cmd)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("stub server 啟動失敗")
+
+
+def run_legacy_slice(path: str) -> dict:
+    """模擬舊流程：每個切片在 Pool worker 中建立新的 client"""
+    import main
+    return asyncio.run(main.process_single_slice(main.create_genai_client(), path))
+
+
+def bench_pool(slice_paths, processes: int) -> float:
+    start = time.perf_counter()
+    with Pool(processes=processes) as pool:
+        pool.map(run_legacy_slice, slice_paths)
+    return time.perf_counter() - start
+
+
+def bench_asyncio(slice_paths, concurrency: int) -> float:
+    import main
+    main.MAP_CONCURRENCY = concurrency
+    # 每個並行度重複使用同一組切片，轉錄完成後不能刪除
+    main.WORKSPACE_KEEP_SLICES = True
+    with tempfile.TemporaryDirectory() as workspace_path:
+        # 每次使用全新的 workspace，避免 manifest 讓切片被直接略過
+        for sub in ("transcript", "summaries"):
+            os.makedirs(os.path.join(workspace_path, sub))
+        state = {"workspace_path": workspace_path, "job_id": None}
+        start = time.perf_counter()
+        main.run_async(main.map_slices(state, slice_paths))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Map 階段吞吐量比較")
+    parser.add_argument("--minutes", type=int, default=120)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upload-latency", type=float, default=0.3)
+    parser.add_argument("--activation-delay", type=float, default=1.0)
+    parser.add_argument("--generate-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["GEMINI_API_KEY"] = "stub"
+    os.environ["CACHE_ENABLED"] = "0"
+    os.environ["MODEL_RPM_LIMITS"] = "gemini-2.5-flash=100000"
+    os.environ["REQUEST_TYPE_RPM_LIMITS"] = "upload=100000,transcribe=100000,summarize=100000"
+
+    import main as backend
+    from bench_slicer import make_synthetic_audio
+
+    audio_dir = os.path.join(tempfile.gettempdir(), "bench_slicer_audio")
+    os.makedirs(audio_dir, exist_ok=True)
+    input_path = os.path.join(audio_dir, f"synthetic_{args.minutes}min.mp3")
+    make_synthetic_audio(input_path, args.minutes)
+
+    stub = start_stub_server(args.port, args)
+    try:
+        with tempfile.TemporaryDirectory() as slice_dir:
+            slice_paths = backend.slice_audio_ffmpeg(input_path, slice_dir)
+            n = len(slice_paths)
+
+            rows = [("Pool(2)", bench_pool(slice_paths, 2))]
+            for c in args.concurrency:
+                rows.append((f"asyncio({c})", bench_asyncio(slice_paths, c)))
+
+            print(f"\n{args.minutes} 分鐘音檔，{n} 個切片")
+            print(f"{'engine':>14} {'seconds':>10} {'slices/min':>12}")
+            for name, seconds in rows:
+                print(f"{name:>14} {seconds:>10.2f} {n / seconds * 60:>12.1f}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+端到端 pipeline 效能測試：process_audio_file（切片 → map → reduce）
+
+以 benchmarks/stub_gemini.py 取代 Gemini API：真正的 genai.Client 透過 HTTP 連到本地 stub，
+延遲、429 比例與 RetryInfo.retryDelay 都可調整，不消耗任何額度。每組設定在獨立子進程中
+透過 JobManager 同時執行 --jobs 個工作（各自獨立的 workspace，快取關閉），回報：
+
+  - slices/min：所有工作處理的切片總數 / 總牆鐘時間
+  - 工作延遲 p50 / p95：從建立工作到完成（含排隊）
+  - 峰值 RSS：子進程（含 ffmpeg 子進程）的 ru_maxrss
+  - 退避時間：遇到 429 / 503 後等待重試的總秒數；另列速率限制器排隊（含 429 冷卻）的總秒數
+
+測試音檔是帶有週期性停頓的合成訊號，讓自適應切片有靜音可以對齊。
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --minutes 10 60 --jobs 4 --error-rate-429 0.1 --retry-delay 5
+    SLICE_STRATEGY=fixed PIPELINE_MODE=barrier python benchmarks/bench_pipeline.py --rpm 30
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+def make_speechlike_audio(path: str, minutes: int, period: int = 37, pause: int = 2):
+    """產生 44.1 kHz 立體聲 mp3：每 period 秒有 pause 秒的靜音，其餘為雜訊"""
+    if os.path.exists(path):
+        return
+    expr = f"if(lt(mod(t\\,{period})\\,{period - pause})\\,0.3*(random(0)-0.5)\\,0)"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"aevalsrc='{expr}':s=44100:d={minutes * 60}",
+        "-ac", "2", "-c:a", "libmp3lame", "-b:a", "128k",
+        path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def metric_sum(registry, name: str) -> float:
+    """加總某個指標所有 label 組合的值"""
+    total = 0.0
+    for metric in registry.collect():
+        for sample in metric.samples:
+            if sample.name == name:
+                total += sample.value
+    return total
+
+
+def run_worker(input_path: str, jobs: int, work_dir: str):
+    """子進程入口：同時送出 jobs 個工作並等待全部完成，結果以 JSON 輸出到 stdout"""
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    main.pwd = work_dir
+    audio_dir = os.path.join(work_dir, "audio")
+    os.makedirs(audio_dir)
+
+    submitted = []
+    for i in range(jobs):
+        file_name = f"bench_{i}{os.path.splitext(input_path)[1]}"
+        file_path = os.path.join(audio_dir, file_name)
+        main.link_or_copy(input_path, file_path)
+        submitted.append(main.job_manager.submit("audio", file_name, main.process_audio_file, file_path, file_name))
+
+    started_at = time.time()
+    for job in submitted:
+        job.future.result()
+    elapsed = time.time() - started_at
+
+    registry = main.REGISTRY
+    report = {
+        "seconds": elapsed,
+        "statuses": [job.status for job in submitted],
+        "latencies": [job.finished_at - job.created_at for job in submitted],
+        "slices": sum((job.result or {}).get("slice_count", 0) for job in submitted),
+        "backoff_seconds": metric_sum(registry, "gemini_quota_backoff_seconds_sum"),
+        "limiter_wait_seconds": metric_sum(registry, "rate_limiter_wait_seconds_sum"),
+        "api_errors": sum(
+            sample.value
+            for metric in registry.collect()
+            for sample in metric.samples
+            if sample.name == "gemini_requests_total" and sample.labels.get("outcome") != "ok"
+        ),
+    }
+    print("REPORT " + json.dumps(report))
+
+
+def measure(input_path: str, jobs: int, env: dict) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", input_path, str(jobs), work_dir]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+        output = proc.stdout.read()
+        _, status, rusage = os.wait4(proc.pid, 0)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"ok": False}
+    for line in output.splitlines():
+        if line.startswith("REPORT "):
+            report = json.loads(line[len("REPORT "):])
+            report["ok"] = os.waitstatus_to_exitcode(status) == 0 and all(
+                s == "succeeded" for s in report["statuses"]
+            )
+    # Linux 上 ru_maxrss 單位為 KB
+    report["peak_rss_mb"] = rusage.ru_maxrss / 1024
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端 pipeline 效能測試")
+    parser.add_argument("--minutes", type=int, nargs="+", default=[10, 30, 60])
+    parser.add_argument("--jobs", type=int, default=2, help="每組同時送出的工作數")
+    parser.add_argument("--rpm", type=int, default=1000, help="模型與各請求類型的每分鐘請求上限")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--upload-latency", type=float, default=0.3)
+    parser.add_argument("--activation-delay", type=float, default=1.0)
+    parser.add_argument("--generate-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate-503", type=float, default=0.0)
+    parser.add_argument("--retry-delay", type=float, default=2.0)
+    parser.add_argument("--audio-dir", default=os.path.join(tempfile.gettempdir(), "bench_slicer_audio"))
+    parser.add_argument("--worker", nargs=3, metavar=("INPUT", "JOBS", "WORK_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        input_path, jobs, work_dir = args.worker
+        run_worker(input_path, int(jobs), work_dir)
+        return
+
+    from bench_map_stage import start_stub_server
+
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{args.port}",
+        "GEMINI_API_KEY": "stub",
+        "CACHE_ENABLED": "0",
+        "MODEL_RPM_LIMITS": f"{env.get('GEMINI_MODEL', 'gemini-2.5-flash')}={args.rpm}",
+        "REQUEST_TYPE_RPM_LIMITS": f"upload={args.rpm},transcribe={args.rpm},summarize={args.rpm}",
+        "MAX_CONCURRENT_JOBS": str(args.jobs),
+    })
+
+    os.makedirs(args.audio_dir, exist_ok=True)
+    stub = start_stub_server(args.port, args)
+    try:
+        print(
+            f"SLICE_STRATEGY={env.get('SLICE_STRATEGY', 'adaptive')} PIPELINE_MODE={env.get('PIPELINE_MODE', 'streaming')} "
+            f"COMBINED_MODE={env.get('COMBINED_MODE', '0')} rpm={args.rpm} 429={args.error_rate_429:g} "
+            f"503={args.error_rate_503:g}"
+        )
+        print(
+            f"{'minutes':>8} {'jobs':>5} {'slices':>7} {'seconds':>9} {'slices/min':>11} {'p50 (s)':>8} "
+            f"{'p95 (s)':>8} {'RSS (MB)':>9} {'errors':>7} {'backoff (s)':>12} {'limiter (s)':>12}"
+        )
+        for minutes in args.minutes:
+            input_path = os.path.join(args.audio_dir, f"speechlike_{minutes}min.mp3")
+            make_speechlike_audio(input_path, minutes)
+            r = measure(input_path, args.jobs, env)
+            if "latencies" not in r:
+                print(f"{minutes:>8} {args.jobs:>5}  (失敗)")
+                continue
+            status = "" if r["ok"] else "  (有工作失敗)"
+            print(
+                f"{minutes:>8} {args.jobs:>5} {r['slices']:>7} {r['seconds']:>9.1f} "
+                f"{r['slices'] / r['seconds'] * 60:>11.1f} {percentile(r['latencies'], 0.5):>8.1f} "
+                f"{percentile(r['latencies'], 0.95):>8.1f} {r['peak_rss_mb']:>9.1f} {r['api_errors']:>7.0f} "
+                f"{r['backoff_seconds']:>12.1f} {r['limiter_wait_seconds']:>12.1f}{status}"
+            )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+切片引擎效能比較：ffmpeg（seek + stream copy）vs pydub（整檔解碼）
+
+每個引擎都在獨立的子進程中執行，以 os.wait4 取得該子進程（含其 ffmpeg 子進程）
+的峰值 RSS 與牆鐘時間。
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/bench_slicer.py
+    python benchmarks/bench_slicer.py --minutes 10 60 180 --engines ffmpeg
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_synthetic_audio(path: str, minutes: int):
+    """用 ffmpeg 產生指定長度的 44.1 kHz 立體聲 mp3（語音頻段的雜訊）"""
+    if os.path.exists(path):
+        return
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:sample_rate=44100:duration={minutes * 60}",
+        "-ac", "2", "-c:a", "libmp3lame", "-b:a", "128k",
+        path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def run_worker(engine: str, input_path: str, out_dir: str):
+    """子進程入口：只執行一次切片"""
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    if engine == "pydub":
+        paths = main.slice_audio_pydub(input_path, out_dir)
+    else:
+        paths = main.slice_audio_ffmpeg(input_path, out_dir)
+    print(f"slices={len(paths)}")
+
+
+def measure(engine: str, input_path: str) -> dict:
+    """在子進程中執行切片，回傳牆鐘時間與峰值 RSS"""
+    with tempfile.TemporaryDirectory() as out_dir:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", engine, input_path, out_dir]
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+    return {
+        "ok": proc.returncode == 0,
+        "seconds": elapsed,
+        # Linux 上 ru_maxrss 單位為 KB
+        "peak_rss_mb": rusage.ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="切片引擎效能比較")
+    parser.add_argument("--minutes", type=int, nargs="+", default=[10, 30, 60, 120, 180])
+    parser.add_argument("--engines", nargs="+", default=["pydub", "ffmpeg"])
+    parser.add_argument("--audio-dir", default=os.path.join(tempfile.gettempdir(), "bench_slicer_audio"))
+    parser.add_argument("--worker", nargs=3, metavar=("ENGINE", "INPUT", "OUT_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    os.makedirs(args.audio_dir, exist_ok=True)
+    print(f"{'minutes':>8} {'engine':>8} {'seconds':>10} {'peak RSS (MB)':>14}")
+    for minutes in args.minutes:
+        input_path = os.path.join(args.audio_dir, f"synthetic_{minutes}min.mp3")
+        make_synthetic_audio(input_path, minutes)
+        for engine in args.engines:
+            r = measure(engine, input_path)
+            status = "" if r["ok"] else "  (失敗，可能為 OOM)"
+            print(f"{minutes:>8} {engine:>8} {r['seconds']:>10.2f} {r['peak_rss_mb']:>14.1f}{status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+冷啟動測試：import main 的時間分布，與 uvicorn 啟動到 /health 可以回應的時間
+
+1. 以 python -X importtime 量測 import main，列出 main 直接 import 的模組中累計時間最長的幾個
+2. 依 --modes 的每種 WARMUP_MODE 各啟動一次 uvicorn，每 10 ms 輪詢 /health，回報：
+     - first /health：從啟動進程到第一次成功回應
+     - warm：從啟動進程到 /health 回報 warmup=ready（lazy 模式不預熱，不適用）
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --modes background eager --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+
+def import_profile(top: int):
+    """回傳 (import main 總毫秒, [(模組, 累計毫秒)])，只計 main 直接 import 的模組"""
+    cmd = [sys.executable, "-X", "importtime", "-c", "import main"]
+    proc = subprocess.run(cmd, cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    total = 0.0
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        ms = int(cumulative) / 1000
+        if name.strip() == "main":
+            total = ms
+        elif name.startswith("   ") and not name.startswith("    "):
+            rows.append((name.strip(), ms))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return total, rows[:top]
+
+
+def get_health(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as resp:
+            return json.load(resp)
+    except OSError:
+        return None
+
+
+def measure_startup(mode: str, port: int, timeout: float) -> dict:
+    env = dict(os.environ, WARMUP_MODE=mode)
+    cmd = [sys.executable, "-m", "uvicorn", "main:fastapi_app", "--port", str(port), "--log-level", "warning"]
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {"first_health": None, "warm": None}
+    try:
+        deadline = start + timeout
+        while time.perf_counter() < deadline:
+            health = get_health(url)
+            now = time.perf_counter() - start
+            if health is not None:
+                if result["first_health"] is None:
+                    result["first_health"] = now
+                if health.get("warmup") == "ready":
+                    result["warm"] = now
+                    break
+                if mode == "lazy" or health.get("warmup") == "failed":
+                    break
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return result
+
+
+def fmt(seconds) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷啟動測試")
+    parser.add_argument("--modes", nargs="+", default=["background", "lazy", "eager"])
+    parser.add_argument("--runs", type=int, default=3, help="每種模式重複次數，取中位數")
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--port", type=int, default=8769)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    # 先 import 一次，讓 .pyc 與磁碟快取就緒，量到的是穩定狀態的啟動時間
+    subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND_DIR, capture_output=True)
+
+    total, rows = import_profile(args.top)
+    print(f"import main: {total:.0f} ms")
+    print(f"{'module':>28} {'cumulative ms':>14}")
+    for name, ms in rows:
+        print(f"{name:>28} {ms:>14.1f}")
+
+    print(f"\n{'WARMUP_MODE':>12} {'first /health ms':>17} {'warm ms':>9}")
+    for mode in args.modes:
+        runs = [measure_startup(mode, args.port, args.timeout) for _ in range(args.runs)]
+        median = {}
+        for key in ("first_health", "warm"):
+            values = sorted(r[key] for r in runs if r[key] is not None)
+            median[key] = values[len(values) // 2] if values else None
+        print(f"{mode:>12} {fmt(median['first_health']):>17} {fmt(median['warm']):>9}")
+
+
+if __name__ == "__main__":
+    main()
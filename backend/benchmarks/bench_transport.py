@@ -0,0 +1,91 @@
+"""
+切片傳送方式比較：Files API upload vs inline bytes
+
+對同一組切片，分別以 TRANSPORT_MODE=upload 與 inline 逐一呼叫 transcribe_slice，
+回報每個切片從開始傳送到拿到逐字稿的延遲。使用本地 stub server，因此網路
+傳輸時間幾乎為零；差異主要來自 round trip 數量與檔案啟用等待。
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/bench_transport.py
+    python benchmarks/bench_transport.py --minutes 30 --activation-delay 2 --generate-latency 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+async def measure_mode(backend, mode: str, slice_paths) -> list:
+    backend.TRANSPORT_MODE = mode
+    audio_client = backend.create_genai_client()
+    watcher = backend.FileActivationWatcher(audio_client)
+    latencies = []
+    for path in slice_paths:
+        start = time.perf_counter()
+        await backend.transcribe_slice(audio_client, path, watcher=watcher)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="切片傳送方式比較")
+    parser.add_argument("--minutes", type=int, default=30)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--upload-latency", type=float, default=0.3)
+    parser.add_argument("--activation-delay", type=float, default=1.0)
+    parser.add_argument("--generate-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["GEMINI_API_KEY"] = "stub"
+    os.environ["MODEL_RPM_LIMITS"] = "gemini-2.5-flash=100000"
+    os.environ["REQUEST_TYPE_RPM_LIMITS"] = "upload=100000,transcribe=100000,summarize=100000"
+
+    import main as backend
+    from bench_slicer import make_synthetic_audio
+    from bench_map_stage import start_stub_server
+
+    audio_dir = os.path.join(tempfile.gettempdir(), "bench_slicer_audio")
+    os.makedirs(audio_dir, exist_ok=True)
+    input_path = os.path.join(audio_dir, f"synthetic_{args.minutes}min.mp3")
+    make_synthetic_audio(input_path, args.minutes)
+
+    stub = start_stub_server(args.port, args)
+    try:
+        with tempfile.TemporaryDirectory() as slice_dir:
+            slice_paths = backend.slice_audio_ffmpeg(input_path, slice_dir)
+            size_mb = statistics.mean(os.path.getsize(p) for p in slice_paths) / 1024 / 1024
+
+            rows = []
+            for mode in ("upload", "inline"):
+                latencies = asyncio.run(measure_mode(backend, mode, slice_paths))
+                rows.append((mode, latencies))
+
+            print(f"\n{len(slice_paths)} 個切片，平均 {size_mb:.1f} MB")
+            print(f"{'mode':>8} {'mean (s)':>10} {'p50 (s)':>10} {'p95 (s)':>10}")
+            for mode, latencies in rows:
+                print(
+                    f"{mode:>8} {statistics.mean(latencies):>10.2f} "
+                    f"{percentile(latencies, 0.5):>10.2f} {percentile(latencies, 0.95):>10.2f}"
+                )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
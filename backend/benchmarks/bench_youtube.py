@@ -0,0 +1,175 @@
+"""
+YouTube 音訊匯入比較：舊流程（最高位元率 + 整檔轉 mp3）vs 直接切原始容器
+
+從「開始下載」到「第一個切片產生」為止，比較牆鐘時間、CPU 時間與峰值 RSS：
+  - legacy：下載最高位元率串流（m4a / AAC 128k），pydub 整檔解碼後重新編碼為 mp3，再切片
+  - direct：下載位元率足夠的最小串流（webm / Opus 50k），直接以 stream copy 切片
+
+離線模式以合成音檔模擬 YouTube 提供的兩種串流，下載以 --bandwidth-mbps 限速的檔案複製模擬；
+指定 --url 時改為實際從 YouTube 下載（需要網路）。每條路徑都在獨立子進程中執行，
+以 os.wait4 取得該子進程（含 ffmpeg 子進程）的資源用量。
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/bench_youtube.py
+    python benchmarks/bench_youtube.py --minutes 60 --bandwidth-mbps 20
+    python benchmarks/bench_youtube.py --url https://www.youtube.com/watch?v=...
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+# YouTube 常見的純音訊串流：itag 140（m4a AAC 128k）與 itag 249（webm Opus 50k）
+FIXTURES = {
+    "best": ("best.m4a", ["-vn", "-c:a", "aac", "-b:a", "128k"]),
+    "small": ("small.webm", ["-vn", "-c:a", "libopus", "-b:a", "50k"]),
+}
+
+
+def make_fixtures(audio_dir: str, minutes: int) -> dict:
+    from bench_slicer import make_synthetic_audio
+
+    source = os.path.join(audio_dir, f"synthetic_{minutes}min.mp3")
+    make_synthetic_audio(source, minutes)
+    paths = {}
+    for name, (file_name, codec_args) in FIXTURES.items():
+        path = os.path.join(audio_dir, f"yt_{minutes}min_{file_name}")
+        if not os.path.exists(path):
+            cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", source] + codec_args + [path]
+            subprocess.run(cmd, check=True)
+        paths[name] = path
+    return paths
+
+
+def throttled_copy(src: str, dst: str, bandwidth_mbps: float):
+    """以固定頻寬複製檔案，模擬下載（睡眠不佔 CPU）"""
+    chunk_size = 256 * 1024
+    bytes_per_second = bandwidth_mbps * 1024 * 1024 / 8
+    start = time.perf_counter()
+    sent = 0
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            chunk = fin.read(chunk_size)
+            if not chunk:
+                break
+            fout.write(chunk)
+            sent += len(chunk)
+            ahead = sent / bytes_per_second - (time.perf_counter() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def legacy_download_url(youtube_url: str, out_dir: str) -> tuple:
+    """舊版 download_youtube_audio：最高位元率串流 + pydub 轉 mp3，回傳 (下載檔, mp3 檔)"""
+    from pytubefix import YouTube
+    from pydub import AudioSegment
+
+    yt = YouTube(youtube_url)
+    stream = yt.streams.filter(only_audio=True).order_by("abr").desc().first()
+    downloaded = stream.download(output_path=out_dir, filename_prefix="yt_")
+    mp3_path = os.path.join(out_dir, "legacy.mp3")
+    AudioSegment.from_file(downloaded).export(mp3_path, format="mp3")
+    return downloaded, mp3_path
+
+
+def run_worker(path_kind: str, source: str, out_dir: str, bandwidth_mbps: float):
+    """子進程入口：下載（或模擬下載）並產生第一個切片"""
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    slice_dir = os.path.join(out_dir, "slices")
+    os.makedirs(slice_dir)
+
+    if source.startswith("http"):
+        if path_kind == "legacy":
+            downloaded, file_path = legacy_download_url(source, out_dir)
+        else:
+            main.pwd = out_dir
+            main.result_cache.enabled = False
+            file_path, _ = main.download_youtube_audio(source)
+            downloaded = file_path
+    else:
+        downloaded = os.path.join(out_dir, os.path.basename(source))
+        throttled_copy(source, downloaded, bandwidth_mbps)
+        if path_kind == "legacy":
+            from pydub import AudioSegment
+            file_path = os.path.join(out_dir, "legacy.mp3")
+            AudioSegment.from_file(downloaded).export(file_path, format="mp3")
+        else:
+            file_path = downloaded
+
+    first_slice = next(main.iter_slices_ffmpeg(file_path, slice_dir))
+    print(f"first_slice={os.path.basename(first_slice)} size={os.path.getsize(downloaded)}")
+
+
+def measure(path_kind: str, source: str, bandwidth_mbps: float) -> dict:
+    with tempfile.TemporaryDirectory() as out_dir:
+        cmd = [
+            sys.executable, os.path.abspath(__file__),
+            "--worker", path_kind, source, out_dir, str(bandwidth_mbps),
+        ]
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        output = proc.stdout.read()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+
+    size = 0
+    for token in output.split():
+        if token.startswith("size="):
+            size = int(token[5:])
+    return {
+        "ok": os.waitstatus_to_exitcode(status) == 0,
+        "seconds": elapsed,
+        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+        # Linux 上 ru_maxrss 單位為 KB
+        "peak_rss_mb": rusage.ru_maxrss / 1024,
+        "download_mb": size / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YouTube 音訊匯入比較")
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--bandwidth-mbps", type=float, default=40.0, help="模擬下載頻寬（Mbit/s）")
+    parser.add_argument("--url", help="實際下載的 YouTube 網址（需要網路）")
+    parser.add_argument("--audio-dir", default=os.path.join(tempfile.gettempdir(), "bench_slicer_audio"))
+    parser.add_argument("--worker", nargs=4, metavar=("PATH", "SOURCE", "OUT_DIR", "MBPS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 兩條路徑都用固定長度切片，只比較匯入本身（自適應切片的靜音分析兩者相同）
+    os.environ.setdefault("SLICE_STRATEGY", "fixed")
+
+    if args.worker:
+        path_kind, source, out_dir, mbps = args.worker
+        run_worker(path_kind, source, out_dir, float(mbps))
+        return
+
+    if args.url:
+        sources = {"legacy": args.url, "direct": args.url}
+        label = args.url
+    else:
+        os.makedirs(args.audio_dir, exist_ok=True)
+        fixtures = make_fixtures(args.audio_dir, args.minutes)
+        sources = {"legacy": fixtures["best"], "direct": fixtures["small"]}
+        label = f"{args.minutes} 分鐘合成音檔，模擬頻寬 {args.bandwidth_mbps:g} Mbit/s"
+
+    print(label)
+    print(f"{'path':>8} {'download (MB)':>14} {'seconds':>10} {'CPU (s)':>10} {'peak RSS (MB)':>14}")
+    for path_kind, source in sources.items():
+        r = measure(path_kind, source, args.bandwidth_mbps)
+        status = "" if r["ok"] else "  (失敗)"
+        print(
+            f"{path_kind:>8} {r['download_mb']:>14.1f} {r['seconds']:>10.2f} "
+            f"{r['cpu_seconds']:>10.2f} {r['peak_rss_mb']:>14.1f}{status}"
+        )
+
+
+if __name__ == "__main__":
+    main()
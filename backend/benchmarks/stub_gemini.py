@@ -0,0 +1,236 @@
+"""
+本地 Gemini API stub server（只實作 pipeline 用到的端點）
+
+實作 google-genai 用到的 REST 介面：
+  - Files API：resumable upload、files.get、files.list、files.delete
+  - models.generateContent、models.streamGenerateContent（SSE）
+
+延遲與錯誤注入都可以調整，讓效能測試不需要消耗真正的 API 額度。
+
+使用方式（在 backend/ 目錄下）：
+    python benchmarks/stub_gemini.py --port 8765 --generate-latency 2.0
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=stub uvicorn main:fastapi_app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class StubConfig:
+    upload_latency = 0.2       # 每次上傳請求的延遲（秒）
+    activation_delay = 1.0     # 上傳完成後多久變成 ACTIVE（秒）
+    get_latency = 0.05         # files.get / list 延遲（秒）
+    generate_latency = 2.0     # generateContent 延遲（秒）
+    error_rate_429 = 0.0       # generateContent 回傳 429 的機率
+    error_rate_503 = 0.0       # generateContent 回傳 503 的機率
+    bad_json_rate = 0.0        # 要求 JSON 輸出時回傳無效 JSON 的機率
+    stream_chunk_delay = 0.05  # 串流回應每段之間的延遲（秒）
+    retry_delay = 2.0          # 429 回應中 RetryInfo.retryDelay（秒）
+
+
+CONFIG_FIELDS = ("upload_latency", "activation_delay", "get_latency", "generate_latency",
+                 "error_rate_429", "error_rate_503", "bad_json_rate", "stream_chunk_delay", "retry_delay")
+
+config = StubConfig()
+app = FastAPI(title="Gemini stub")
+
+# name -> {"created": ts, "ready_at": ts, "mime_type": str, "size": int}
+files = {}
+# upload session id -> file metadata
+sessions = {}
+stats = {"uploads": 0, "gets": 0, "generates": 0, "errors_429": 0, "errors_503": 0, "connections": 0}
+# 見過的用戶端連線 (host, port)，用來計算 client 建立了多少條連線
+peers = set()
+
+
+@app.middleware("http")
+async def count_connections(request: Request, call_next):
+    peer = request.scope.get("client")
+    if peer and tuple(peer) not in peers:
+        peers.add(tuple(peer))
+        stats["connections"] = len(peers)
+    return await call_next(request)
+
+
+def file_resource(name: str, request: Request) -> dict:
+    meta = files[name]
+    state = "ACTIVE" if time.time() >= meta["ready_at"] else "PROCESSING"
+    return {
+        "name": name,
+        "mimeType": meta["mime_type"],
+        "sizeBytes": str(meta["size"]),
+        "state": state,
+        "uri": f"{str(request.base_url).rstrip('/')}/v1beta/{name}",
+    }
+
+
+def quota_error() -> JSONResponse:
+    stats["errors_429"] += 1
+    return JSONResponse(
+        status_code=429,
+        content={
+            "error": {
+                "code": 429,
+                "message": f"Resource has been exhausted (e.g. check quota). Please retry in {config.retry_delay}s.",
+                "status": "RESOURCE_EXHAUSTED",
+                "details": [
+                    {
+                        "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                        "retryDelay": f"{config.retry_delay:g}s",
+                    }
+                ],
+            }
+        },
+    )
+
+
+def unavailable_error() -> JSONResponse:
+    stats["errors_503"] += 1
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"code": 503, "message": "The model is overloaded. Please try again later.", "status": "UNAVAILABLE"}},
+    )
+
+
+@app.post("/upload/v1beta/files")
+async def start_upload(request: Request):
+    body = await request.json()
+    session_id = uuid.uuid4().hex
+    sessions[session_id] = body.get("file", {})
+    upload_url = f"{str(request.base_url).rstrip('/')}/upload/v1beta/files/session/{session_id}"
+    return JSONResponse(content={}, headers={"X-Goog-Upload-URL": upload_url})
+
+
+@app.post("/upload/v1beta/files/session/{session_id}")
+async def upload_chunk(session_id: str, request: Request):
+    data = await request.body()
+    command = request.headers.get("X-Goog-Upload-Command", "")
+    meta = sessions[session_id]
+    meta["size"] = meta.get("size", 0) + len(data)
+
+    if "finalize" not in command:
+        return JSONResponse(content={}, headers={"X-Goog-Upload-Status": "active"})
+
+    await asyncio.sleep(config.upload_latency)
+    stats["uploads"] += 1
+    name = f"files/{uuid.uuid4().hex[:12]}"
+    now = time.time()
+    files[name] = {
+        "created": now,
+        "ready_at": now + config.activation_delay,
+        "mime_type": meta.get("mimeType", "audio/mpeg"),
+        "size": meta["size"],
+    }
+    del sessions[session_id]
+    return JSONResponse(
+        content={"file": file_resource(name, request)},
+        headers={"X-Goog-Upload-Status": "final"},
+    )
+
+
+@app.get("/v1beta/files/{file_id}")
+async def get_file(file_id: str, request: Request):
+    await asyncio.sleep(config.get_latency)
+    stats["gets"] += 1
+    name = f"files/{file_id}"
+    if name not in files:
+        return JSONResponse(status_code=404, content={"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+    return file_resource(name, request)
+
+
+@app.get("/v1beta/files")
+async def list_files(request: Request):
+    await asyncio.sleep(config.get_latency)
+    stats["gets"] += 1
+    return {"files": [file_resource(name, request) for name in files]}
+
+
+@app.delete("/v1beta/files/{file_id}")
+async def delete_file(file_id: str):
+    files.pop(f"files/{file_id}", None)
+    return {}
+
+
+@app.post("/v1beta/models/{model_action}")
+async def generate_content(model_action: str, request: Request):
+    body = await request.json()
+    await asyncio.sleep(config.generate_latency)
+    stats["generates"] += 1
+
+    if config.error_rate_429 and random.random() < config.error_rate_429:
+        return quota_error()
+    if config.error_rate_503 and random.random() < config.error_rate_503:
+        return unavailable_error()
+
+    parts = [p for c in body.get("contents", []) for p in c.get("parts", [])]
+    has_audio = any("fileData" in p or "inlineData" in p for p in parts)
+    transcript = "這是一段 stub 逐字稿內容。" * 50
+    summary = "stub 摘要：主要內容概述與關鍵要點。"
+    text = transcript if has_audio else summary
+
+    generation_config = body.get("generationConfig") or {}
+    if generation_config.get("responseMimeType") == "application/json":
+        if config.bad_json_rate and random.random() < config.bad_json_rate:
+            text = '{"transcript": "truncated'
+        else:
+            text = json.dumps({"transcript": transcript, "summary": summary}, ensure_ascii=False)
+
+    if model_action.endswith(":streamGenerateContent"):
+        return StreamingResponse(stream_chunks(model_action, text), media_type="text/event-stream")
+    return generate_response(model_action, text)
+
+
+def generate_response(model_action: str, text: str, finished: bool = True) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": len(text), "totalTokenCount": 100 + len(text)},
+        "modelVersion": model_action.split(":")[0],
+    }
+
+
+async def stream_chunks(model_action: str, text: str, chunk_count: int = 8):
+    """把回應切成數段，以 SSE 逐段送出（模擬逐 token 產生）"""
+    size = max(1, -(-len(text) // chunk_count))
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    for i, chunk in enumerate(chunks):
+        payload = generate_response(model_action, chunk, finished=i == len(chunks) - 1)
+        yield f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n"
+        await asyncio.sleep(config.stream_chunk_delay)
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Gemini API stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ssl-certfile", help="以 HTTPS 提供服務（用來量測 TLS 握手）")
+    parser.add_argument("--ssl-keyfile")
+    for field in CONFIG_FIELDS:
+        parser.add_argument(f"--{field.replace('_', '-')}", type=float, default=getattr(StubConfig, field))
+    args = parser.parse_args()
+
+    for field in CONFIG_FIELDS:
+        setattr(config, field, getattr(args, field))
+
+    uvicorn.run(
+        app, host=args.host, port=args.port, log_level="warning",
+        ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,86 @@
+from __future__ import annotations
+
 import os
 import time
 import math
 import re
-from typing import Annotated, List, Dict, Any, Optional
+import json
+import subprocess
+import asyncio
+import importlib
+import importlib.util
+from typing import Annotated, List, Dict, Any, Optional, Callable
 from typing_extensions import TypedDict
-from langgraph.graph import StateGraph
-from langgraph.graph.message import add_messages
-import google.generativeai as genai 
-
-from google.api_core import exceptions as google_exceptions
 from pydub import AudioSegment
-from multiprocessing import Pool, cpu_count
-from collections import deque
+import multiprocessing
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import threading
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+import uuid
+import hashlib
+import random
+import difflib
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Form, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, ValidationError
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+import functools
+import contextlib
 import shutil
-# 導入 pytube
+import ssl
+import aiofiles
 try:
-    from pytubefix import YouTube
-    from pytubefix.cli import on_progress
+    from python_multipart.multipart import MultipartParser, parse_options_header
 except ImportError:
+    # python-multipart < 0.0.13 的模組名稱
+    from multipart.multipart import MultipartParser, parse_options_header
+
+class LazyModule:
+    """
+    第一次存取屬性時才 import 的模組
+
+    google-genai、langgraph、pytubefix 等套件 import 就要花上數百毫秒到一秒，
+    延後到第一次處理請求（或背景預熱）時才載入，讓服務啟動後能立刻回應健康檢查。
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+genai_errors = LazyModule("google.genai.errors")
+certifi = LazyModule("certifi")
+httpx = LazyModule("httpx")
+# 沒有 aiohttp 時 google-genai 的非同步請求改走 httpx
+aiohttp = LazyModule("aiohttp") if importlib.util.find_spec("aiohttp") else None
+# 導入 pytube（只檢查是否安裝，實際載入延後到第一次下載）
+if importlib.util.find_spec("pytubefix") is None:
     print("⚠️ 請安裝 pytubefix: pip install pytubefix")
-    raise
+    raise ImportError("No module named 'pytubefix'")
+pytubefix = LazyModule("pytubefix")
+pytubefix_cli = LazyModule("pytubefix.cli")
+extract = LazyModule("pytubefix.extract")
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """服務開始接受連線時在背景執行緒預熱（WARMUP_MODE=background），不阻擋健康檢查"""
+    if WARMUP_MODE == "background":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
 
 # FastAPI app 初始化
-fastapi_app = FastAPI(title="Audio Processing API")
+fastapi_app = FastAPI(title="Audio Processing API", lifespan=lifespan)
 
 # 添加 CORS 中間件
 frontend_url = "https://bda-final-project-1.onrender.com"
@@ -50,110 +103,1150 @@ fastapi_app.add_middleware(
     allow_headers=["*"],
 )
 api_key = os.environ.get("GEMINI_API_KEY")
+# 自訂 Gemini API 位址（例如本地 stub server），未設定時使用官方端點
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
 pwd = os.getcwd()
 
+# 結果快取：以內容雜湊為 key，存放逐字稿、摘要與 YouTube 音檔
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") == "1"
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(pwd, "cache"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 1024 * 1024 * 1024))  # 1 GB
+
+# 工作目錄（audio/<key>/ 與 workspace/<key>/）的保留設定
+WORKSPACE_MAX_BYTES = int(os.environ.get("WORKSPACE_MAX_BYTES", 20 * 1024 * 1024 * 1024))  # 20 GB
+WORKSPACE_TTL_HOURS = float(os.environ.get("WORKSPACE_TTL_HOURS", 72))  # 超過此時間未使用即刪除，0 表示不限
+# 0: 切片轉錄完成後立即刪除切片音檔（斷點續跑時會重新切出）；1: 保留
+WORKSPACE_KEEP_SLICES = os.environ.get("WORKSPACE_KEEP_SLICES", "0") == "1"
+
+# 切片設定
+SEGMENT_LENGTH_MS = 5 * 60 * 1000  # 5 minutes
+OVERLAP_LENGTH_MS = 20 * 1000      # 20 seconds
+# adaptive: 在目標長度附近的靜音處下刀，目標長度依並行數與剩餘額度決定；fixed: 固定長度 + 重疊
+SLICE_STRATEGY = os.environ.get("SLICE_STRATEGY", "adaptive")
+ADAPTIVE_MIN_SEGMENT_MS = 2 * 60 * 1000   # 額度充足時的最短切片
+ADAPTIVE_MAX_SEGMENT_MS = 15 * 60 * 1000  # 額度緊張時的最長切片
+# 在目標切點前後 SILENCE_SEARCH_RATIO * 目標長度 的範圍內尋找靜音
+SILENCE_SEARCH_RATIO = float(os.environ.get("SILENCE_SEARCH_RATIO", 0.15))
+SILENCE_NOISE_DB = float(os.environ.get("SILENCE_NOISE_DB", -35))
+SILENCE_MIN_DURATION = float(os.environ.get("SILENCE_MIN_DURATION", 0.4))  # 秒
+# 靜音偵測在降取樣的單聲道訊號上進行，成本遠低於完整解碼
+SILENCE_ANALYSIS_SAMPLE_RATE = 8000
+# 相鄰切片重疊區的逐字稿對齊：至少要有這麼長的相同片段（字元）才視為重複內容
+STITCH_MIN_MATCH_CHARS = int(os.environ.get("STITCH_MIN_MATCH_CHARS", 12))
+# ffmpeg: 以 seek + stream copy 切片（記憶體固定）；pydub: 舊的整檔解碼流程
+SLICE_ENGINE = os.environ.get("SLICE_ENGINE", "ffmpeg")
+# 同時執行的切片編碼工作數（每個工作是一個 ffmpeg 子進程）
+SLICE_WORKERS = int(os.environ.get("SLICE_WORKERS", cpu_count()))
+
+# streaming: 切片一產生就送去轉錄；barrier: 全部切完才開始轉錄（舊流程）
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "streaming")
+# 已切好、但尚未開始轉錄的切片上限
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 4))
+# 同時處理中的切片上限；實際吞吐量由速率限制器的額度決定
+MAP_CONCURRENCY = int(os.environ.get("MAP_CONCURRENCY", 64))
+
+def parse_rpm_limits(spec: str) -> Dict[str, int]:
+    """解析 "name=rpm,name=rpm" 格式的額度設定"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, rpm = item.split("=", 1)
+        try:
+            rpm = int(rpm)
+        except ValueError:
+            rpm = 0
+        if rpm <= 0:
+            print(f"⚠️ 忽略無效的額度設定 {item.strip()}：每分鐘請求數必須是大於 0 的整數")
+            continue
+        limits[name.strip()] = rpm
+    return limits
+
+# Gemini 模型與每分鐘請求額度
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+MODEL_RPM_LIMITS = parse_rpm_limits(os.environ.get("MODEL_RPM_LIMITS", f"{GEMINI_MODEL}=10"))
+REQUEST_TYPE_RPM_LIMITS = parse_rpm_limits(
+    os.environ.get("REQUEST_TYPE_RPM_LIMITS", "upload=30,transcribe=10,summarize=10")
+)
+
+# Gemini 連線池：每個工作執行緒一個長駐的 client，跨切片與工作重複使用 keep-alive 連線
+GEMINI_POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", 32))  # 每個 client 的連線數上限
+GEMINI_KEEPALIVE_SECONDS = float(os.environ.get("GEMINI_KEEPALIVE_SECONDS", 60))  # 閒置連線保留時間
+GEMINI_CLIENT_MAX_AGE = float(os.environ.get("GEMINI_CLIENT_MAX_AGE", 3600))  # 超過此秒數重建 client，0 表示不限
+GEMINI_CLIENT_MAX_ERRORS = int(os.environ.get("GEMINI_CLIENT_MAX_ERRORS", 3))  # 連續網路錯誤達此次數時重建
+
+# API 重試：暫時性錯誤（5xx、逾時、連線中斷）以指數退避加隨機抖動重試
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", 1.0))  # 秒
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", 30.0))  # 秒
+# 429 沒有附 retryDelay 時的冷卻起點（秒），之後每次加倍，上限為速率限制的時間窗
+QUOTA_RETRY_BASE_DELAY = float(os.environ.get("QUOTA_RETRY_BASE_DELAY", 15.0))
+
+# 切片傳送方式：auto 依大小自動選擇；inline 直接放進請求；upload 一律走 Files API
+TRANSPORT_MODE = os.environ.get("TRANSPORT_MODE", "auto")
+# inline 的切片大小上限（請求上限 20 MB，base64 編碼後約膨脹 4/3）
+INLINE_MAX_BYTES = int(os.environ.get("INLINE_MAX_BYTES", 14 * 1024 * 1024))
+INLINE_HARD_LIMIT_BYTES = 15 * 1024 * 1024
+
+# 單次呼叫同時產生逐字稿與摘要（結構化輸出），解析失敗時退回兩次呼叫
+COMBINED_MODE = os.environ.get("COMBINED_MODE", "0") == "1"
+
+# 上傳後等待檔案變成 ACTIVE：指數退避（含隨機抖動）的檢查間隔與逾時
+FILE_ACTIVATION_INITIAL_DELAY = float(os.environ.get("FILE_ACTIVATION_INITIAL_DELAY", 0.3))
+FILE_ACTIVATION_BACKOFF = float(os.environ.get("FILE_ACTIVATION_BACKOFF", 1.5))
+FILE_ACTIVATION_MAX_DELAY = float(os.environ.get("FILE_ACTIVATION_MAX_DELAY", 8.0))
+FILE_ACTIVATION_TIMEOUT = float(os.environ.get("FILE_ACTIVATION_TIMEOUT", 120.0))
+# 同時到期的待檢查檔案達到此數量時，改用一次 files.list 取代逐一 files.get
+FILE_ACTIVATION_LIST_THRESHOLD = int(os.environ.get("FILE_ACTIVATION_LIST_THRESHOLD", 3))
+
+# 分層 reduce：切片摘要先以每 REDUCE_GROUP_SIZE 個一組合併，
+# 之後每層以 REDUCE_FAN_IN 個一組合併，直到數量不超過 REDUCE_FAN_IN 再產生最終摘要
+REDUCE_GROUP_SIZE = int(os.environ.get("REDUCE_GROUP_SIZE", 8))
+REDUCE_FAN_IN = int(os.environ.get("REDUCE_FAN_IN", 4))
+
+# YouTube：選擇位元率不低於此值的最小音訊串流（語音不需要最高音質）
+YOUTUBE_MIN_ABR_KBPS = int(os.environ.get("YOUTUBE_MIN_ABR_KBPS", 48))
+
+# 上傳檔案大小上限
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 1024 * 1024 * 1024))  # 1 GB
+# 不必讀到檔尾就能解碼的格式：上傳的同時即可進行靜音分析
+STREAMABLE_UPLOAD_EXTENSIONS = {".mp3", ".aac", ".ogg", ".opus", ".flac", ".wav"}
+
+# SSE：沒有新事件時的檢查間隔，以及送出 keep-alive 註解的間隔（秒）
+SSE_POLL_INTERVAL = float(os.environ.get("SSE_POLL_INTERVAL", 0.25))
+SSE_KEEPALIVE_INTERVAL = float(os.environ.get("SSE_KEEPALIVE_INTERVAL", 15))
+
+# 背景工作：同時執行的 pipeline 數量，與排隊等待的工作上限
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", 2))
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", 20))
+# 保留在記憶體中供查詢的已結束工作數量
+JOB_HISTORY_LIMIT = int(os.environ.get("JOB_HISTORY_LIMIT", 200))
+# 每個工作從開始執行起的時間上限（秒），超過時停止重試並結束工作；0 表示不限制
+JOB_DEADLINE_SECONDS = float(os.environ.get("JOB_DEADLINE_SECONDS", 3600))
+# 大型相依套件與 LangGraph 流程圖的載入時機：
+# background（啟動後在背景執行緒預熱）、lazy（第一次處理請求時才載入）、eager（import 時就載入）
+WARMUP_MODE = os.environ.get("WARMUP_MODE", "background")
+
+# 切片副檔名 -> inline 傳送時的 MIME type
+SLICE_MIME_TYPES = {
+    ".mp3": "audio/mp3",
+    ".aac": "audio/aac",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".wav": "audio/wav",
+}
+
+# 可直接 stream copy 的音訊編碼 -> 切片容器副檔名
+STREAM_COPY_CONTAINERS = {
+    "mp3": ".mp3",
+    "aac": ".aac",
+    "flac": ".flac",
+    "vorbis": ".ogg",
+    "opus": ".ogg",
+    "pcm_s16le": ".wav",
+}
+
+# =====================================
+# 監控指標（Prometheus，於 /metrics 輸出）
+# =====================================
+STAGE_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+STEP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "LangGraph 各節點的執行時間", ["stage"], buckets=STAGE_BUCKETS
+)
+SLICE_STEP_SECONDS = Histogram(
+    "slice_step_seconds", "單一切片各步驟的執行時間（含排隊與重試）", ["step"], buckets=STEP_BUCKETS
+)
+GEMINI_REQUESTS = Counter("gemini_requests_total", "Gemini API 請求數", ["request_type", "outcome"])
+GEMINI_RETRIES = Counter("gemini_retries_total", "遇到配額限制 (429) 或暫時性錯誤後的重試次數", ["request_type"])
+GEMINI_BACKOFF_SECONDS = Histogram(
+    "gemini_quota_backoff_seconds", "遇到 429 或暫時性錯誤後等待重試的秒數", ["request_type"], buckets=STEP_BUCKETS
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "rate_limiter_wait_seconds", "速率限制器排隊等待的秒數", ["request_type"],
+    buckets=(0, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300),
+)
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Gemini 回報的 token 用量", ["request_type", "direction"])
+SLICE_BYTES_SENT = Counter("slice_bytes_sent_total", "送往 Gemini 的切片音訊位元組數", ["transport"])
+UPLOAD_BYTES_RECEIVED = Counter("upload_bytes_received_total", "使用者上傳的音檔位元組數")
+CACHE_LOOKUPS = Counter("result_cache_lookups_total", "結果快取查詢次數", ["kind", "result"])
+JOB_SECONDS = Histogram(
+    "job_duration_seconds", "背景工作從開始執行到結束的時間", ["kind", "status"], buckets=STAGE_BUCKETS
+)
+GEMINI_CLIENTS_CREATED = Counter(
+    "gemini_clients_created_total", "建立的 Gemini client 數（含健康檢查重建）", ["reason"]
+)
+JOBS_RUNNING = Gauge("jobs_running", "執行中的背景工作數量", multiprocess_mode="livesum")
+WORKSPACE_BYTES = Gauge("workspace_bytes", "audio/ 與 workspace/ 目前的總大小", multiprocess_mode="liveall")
+WORKSPACE_EVICTIONS = Counter("workspace_evictions_total", "垃圾回收刪除的工作目錄數", ["reason"])
+
+def timed_node(stage: str, node):
+    """包裝 LangGraph 節點，記錄執行時間"""
+    @functools.wraps(node)
+    def run(state):
+        with PIPELINE_STAGE_SECONDS.labels(stage).time():
+            return node(state)
+    return run
+
+def record_token_usage(request_type: str, usage) -> None:
+    if usage is None:
+        return
+    GEMINI_TOKENS.labels(request_type, "prompt").inc(usage.prompt_token_count or 0)
+    GEMINI_TOKENS.labels(request_type, "output").inc(usage.candidates_token_count or 0)
+
+def metrics_registry():
+    """多個 worker 進程時（設定 PROMETHEUS_MULTIPROC_DIR）合併各進程的指標"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+# add_messages 由 build_langgraph_app 載入 langgraph 時才定義，型別註記到編譯流程圖時才解析
 class AllState(TypedDict):
     messages: Annotated[list, add_messages]
+    job_id: Optional[str]
     raw_audio_path: str
     workspace_path: str
     file_name: str
+    slice_paths: List[str]
     slice_summaries: List[str]
     final_summary: str
+    cache_stats: Dict[str, int]
+    dedup_stats: Dict[str, int]
+
+# Prompt 也是快取 key 的一部分，修改內容會讓舊的快取自然失效
+TRANSCRIBE_PROMPT = 'Generate a transcript of the speech.'
+
+SLICE_SUMMARY_PROMPT = """
+                請為以下文本生成一個簡潔的摘要，包含：
+                1. 主要內容概述
+                2. 關鍵要點（3-5個）
+                3. 重要決策或結論（如果有的話）
+
+                文本內容：
+                ---
+                {transcript}
+                ---
+
+                摘要：
+                """
+
+COMBINED_PROMPT = """
+Generate a transcript of the speech, then summarize it.
+
+Return JSON with two fields:
+- "transcript": the full transcript of the speech.
+- "summary": 以繁體中文撰寫的簡潔摘要，包含：
+  1. 主要內容概述
+  2. 關鍵要點（3-5個）
+  3. 重要決策或結論（如果有的話）
+
+If there is no speech, return empty strings for both fields.
+"""
+
+GROUP_SUMMARY_PROMPT = """
+    以下是同一段錄音中連續幾個片段的摘要（依時間順序排列）。
+    請將它們合併成一份涵蓋這整段內容的摘要，供後續再與其他段落合併。
+    
+    要求：
+    1. 保留所有關鍵要點、決策、結論與行動項目
+    2. 去除片段之間重複的內容
+    3. 保持時間順序
+    
+    各片段摘要：
+    ---
+    {summaries}
+    ---
+    
+    合併摘要：
+    """
+
+FINAL_SUMMARY_PROMPT = """
+    請基於以下各個片段的摘要，生成一個完整的、結構化的最終摘要。
+    
+    要求：
+    1. 提供整體內容的主旨概述
+    2. 整理並合併所有關鍵要點（去除重複）
+    3. 識別重要的決策、結論或行動項目
+    4. 保持邏輯順序和連貫性
+    5. 使用清晰的標題和結構
+    
+    各片段摘要：
+    ---
+    {summaries}
+    ---
+    
+    最終摘要：
+    """
 
 class YouTubeRequest(BaseModel):
     """YouTube 網址請求模型"""
     url: str
 
+class SliceTranscription(BaseModel):
+    """COMBINED_MODE 的結構化輸出：逐字稿與摘要"""
+    transcript: str
+    summary: str
+
 class RateLimiter:
-    """速率限制器，確保不超過 Gemini API 的限制"""
+    """
+    跨進程共用的速率限制器，確保不超過 Gemini API 的限制
+
+    每個額度（依模型、依請求類型）是一個長度為 rpm 的環狀時間表，存放最近 rpm 個
+    請求的預定發送時間。時間表放在共享記憶體中，fork 出的子進程、同一進程內的
+    所有執行緒與 asyncio 工作共用同一份額度。取得額度時只在鎖內「預約」發送時間，
+    鎖外才睡眠，因此等待者依到達順序排隊，也不會因為睡眠而卡住其他請求。
+
+    伺服器回報 429 時以 cooldown() 設定冷卻截止時間，所有共用該額度的請求都等到
+    冷卻結束才發送，避免其他 worker 在額度用盡期間繼續撞上 429。
+    """
     
-    def __init__(self, max_requests_per_minute=10):
-        self.max_requests_per_minute = max_requests_per_minute
-        self.requests = deque()
-        self.lock = threading.Lock()
-        print(f"🚦 速率限制器初始化：每分鐘最多 {max_requests_per_minute} 個請求")
+    WINDOW_SECONDS = 60 + 1  # 多留 1 秒緩衝
     
-    def wait_if_needed(self):
-        """如果需要，等待直到可以發送下一個請求"""
+    def __init__(self, model_limits: Dict[str, int], request_type_limits: Dict[str, int]):
+        self.limits = {f"model:{name}": rpm for name, rpm in model_limits.items()}
+        self.limits.update({f"type:{name}": rpm for name, rpm in request_type_limits.items()})
+        
+        self.buckets = {}
+        offset = 0
+        for index, (key, rpm) in enumerate(self.limits.items()):
+            self.buckets[key] = (index, offset, rpm)
+            offset += rpm
+        
+        self.lock = multiprocessing.Lock()
+        self.times = multiprocessing.RawArray('d', max(offset, 1))
+        self.heads = multiprocessing.RawArray('i', max(len(self.buckets), 1))
+        # 各額度的冷卻截止時間；最後一格給沒有設定額度的請求使用
+        self.cooldowns = multiprocessing.RawArray('d', len(self.buckets) + 1)
+        
+        budgets = ", ".join(f"{key}={rpm}" for key, rpm in self.limits.items())
+        print(f"🚦 速率限制器初始化（每分鐘請求上限）：{budgets}")
+    
+    def _keys(self, model: Optional[str], request_type: Optional[str]) -> List[str]:
+        return [key for key in (f"model:{model}", f"type:{request_type}") if key in self.buckets]
+    
+    def _cooldown_slots(self, keys: List[str]) -> List[int]:
+        return [self.buckets[key][0] for key in keys] or [len(self.buckets)]
+    
+    def reserve(self, model: Optional[str] = None, request_type: Optional[str] = None) -> float:
+        """預約下一個可發送的時間點（不早於冷卻結束），回傳需要等待的秒數"""
+        keys = self._keys(model, request_type)
+        
         with self.lock:
             now = time.time()
-            while self.requests and now - self.requests[0] > 60:
-                self.requests.popleft()
-            
-            if len(self.requests) >= self.max_requests_per_minute:
-                sleep_time = 60 - (now - self.requests[0]) + 1
-                if sleep_time > 0:
-                    print(f"⏳ 速率限制：等待 {sleep_time:.1f} 秒...")
-                    time.sleep(sleep_time)
-                    now = time.time()
-                    while self.requests and now - self.requests[0] > 60:
-                        self.requests.popleft()
+            send_at = max([now] + [self.cooldowns[i] for i in self._cooldown_slots(keys)])
+            for key in keys:
+                index, offset, rpm = self.buckets[key]
+                head = self.heads[index]
+                oldest = self.times[offset + head]
+                newest = self.times[offset + (head - 1) % rpm]
+                # 同一額度內保持先到先發，且任意時間窗內不超過 rpm 個請求
+                send_at = max(send_at, oldest + self.WINDOW_SECONDS, newest)
             
-            self.requests.append(now)
+            for key in keys:
+                index, offset, rpm = self.buckets[key]
+                head = self.heads[index]
+                self.times[offset + head] = send_at
+                self.heads[index] = (head + 1) % rpm
+        
+        return send_at - now
+    
+    def cooldown(self, seconds: float, model: Optional[str] = None, request_type: Optional[str] = None):
+        """暫停所有共用此額度的請求 seconds 秒（只會延長、不會縮短已有的冷卻）"""
+        with self.lock:
+            until = time.time() + seconds
+            for i in self._cooldown_slots(self._keys(model, request_type)):
+                self.cooldowns[i] = max(self.cooldowns[i], until)
+    
+    def cooldown_remaining(self, model: Optional[str] = None, request_type: Optional[str] = None) -> float:
+        """距離冷卻結束還有幾秒"""
+        with self.lock:
+            until = max(self.cooldowns[i] for i in self._cooldown_slots(self._keys(model, request_type)))
+        return max(0.0, until - time.time())
+    
+    async def wait_if_needed_async(self, model: Optional[str] = None, request_type: Optional[str] = None):
+        """如果需要，等待直到可以發送下一個請求；等待時不阻塞事件迴圈"""
+        start = time.time()
+        sleep_time = self.reserve(model, request_type)
+        if sleep_time > 0:
+            print(f"⏳ 速率限制 ({request_type or model})：等待 {sleep_time:.1f} 秒...")
+            await asyncio.sleep(sleep_time)
+        # 排隊期間可能有其他請求遇到 429 而開始冷卻
+        remaining = self.cooldown_remaining(model, request_type)
+        while remaining > 0:
+            await asyncio.sleep(remaining)
+            remaining = self.cooldown_remaining(model, request_type)
+        RATE_LIMIT_WAIT_SECONDS.labels(request_type or "other").observe(time.time() - start)
+
+    def available(self, model: Optional[str] = None, request_type: Optional[str] = None) -> Optional[int]:
+        """目前時間窗內還能立即發送的請求數；沒有設定額度時回傳 None"""
+        keys = self._keys(model, request_type)
+        if not keys:
+            return None
+        
+        with self.lock:
+            cutoff = time.time() - self.WINDOW_SECONDS
+            free = []
+            for key in keys:
+                _, offset, rpm = self.buckets[key]
+                free.append(sum(1 for i in range(rpm) if self.times[offset + i] <= cutoff))
+        return min(free)
 
 # 全域速率限制器
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(MODEL_RPM_LIMITS, REQUEST_TYPE_RPM_LIMITS)
 
-def parse_retry_delay(error_dict: dict) -> float:
-    """從錯誤響應中解析 retryDelay"""
+def link_or_copy(src_path: str, dst_path: str):
+    """優先建立 hard link 以節省磁碟空間，跨檔案系統時改為複製"""
+    if os.path.exists(dst_path):
+        os.remove(dst_path)
     try:
-        details = error_dict.get('error', {}).get('details', [])
-        for detail in details:
-            if detail.get('@type') == 'type.googleapis.com/google.rpc.RetryInfo':
-                retry_delay = detail.get('retryDelay', '60s')
-                if isinstance(retry_delay, str) and retry_delay.endswith('s'):
-                    return float(retry_delay[:-1])
-        return 60.0
-    except Exception as e:
-        print(f"⚠️ 解析 retryDelay 失敗: {e}，使用預設值 60 秒")
-        return 60.0
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copyfile(src_path, dst_path)
 
-def api_call_with_retry(func, *args, max_retries=5, **kwargs):
-    """帶重試邏輯的 API 調用包裝器"""
-    retry_count = 0
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """以串流方式計算檔案的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    本機磁碟上的內容雜湊快取
+
+    每個項目存放在 <CACHE_DIR>/<kind>/<key>/<name>，命中時更新 mtime，
+    總大小超過 max_bytes 時依 mtime 由舊到新刪除（LRU）。
+    """
     
-    while retry_count <= max_retries:
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.total_bytes = None  # 第一次寫入時才掃描目錄
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+    
+    def _entry_dir(self, kind: str, key: str) -> str:
+        return os.path.join(self.cache_dir, kind, key)
+    
+    def get_path(self, kind: str, key: str, name: Optional[str] = None) -> Optional[str]:
+        """
+        回傳快取檔案路徑，不存在時回傳 None
+
+        name 為 None 時取項目中唯一的檔案（put_file 時檔名不固定），略過寫入中的 . 開頭暫存檔。
+        """
+        if not self.enabled:
+            return None
+        entry_dir = self._entry_dir(kind, key)
+        try:
+            if name is None:
+                name = [n for n in os.listdir(entry_dir) if not n.startswith(".")][0]
+            path = os.path.join(entry_dir, name)
+            os.utime(path)
+        except (FileNotFoundError, IndexError):
+            CACHE_LOOKUPS.labels(kind, "miss").inc()
+            return None
+        CACHE_LOOKUPS.labels(kind, "hit").inc()
+        return path
+    
+    def get_text(self, kind: str, key: str) -> Optional[str]:
+        path = self.get_path(kind, key, "value.txt")
+        if path is None:
+            return None
         try:
-            rate_limiter.wait_if_needed()
-            return func(*args, **kwargs)
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def put_text(self, kind: str, key: str, value: str):
+        if not self.enabled:
+            return
+        entry_dir = self._entry_dir(kind, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        tmp_path = os.path.join(entry_dir, f".value.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(value)
+        self._commit(tmp_path, os.path.join(entry_dir, "value.txt"))
+    
+    def put_file(self, kind: str, key: str, src_path: str, name: str) -> str:
+        """把檔案放進快取，回傳快取內的路徑"""
+        entry_dir = self._entry_dir(kind, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        tmp_path = os.path.join(entry_dir, f".{name}.{uuid.uuid4().hex}.tmp")
+        link_or_copy(src_path, tmp_path)
+        return self._commit(tmp_path, os.path.join(entry_dir, name))
+    
+    def _commit(self, tmp_path: str, final_path: str) -> str:
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, final_path)
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self._scan()[1]
+            else:
+                self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        return final_path
+    
+    def _scan(self) -> tuple:
+        entries = []
+        total = 0
+        now = time.time()
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # 寫入中的暫存檔不計入也不清理；超過一小時仍在的是中斷寫入的殘留，照常清理
+                if name.startswith(".") and now - stat.st_mtime < 3600:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+    
+    def _evict(self):
+        """刪除最久未使用的項目，直到總大小降到上限的 90%"""
+        entries, total = self._scan()
+        entries.sort()
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+            total -= size
+            removed += 1
+        self.total_bytes = total
+        print(f"🧹 快取清理：移除 {removed} 個項目，目前 {total / 1024 / 1024:.1f} MB")
+
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_ENABLED)
+
+def write_text_atomic(path: str, text: str):
+    """先寫入暫存檔再 rename，程序中途終止也不會留下寫一半的檔案"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+class WorkspaceManifest:
+    """
+    workspace/<file>/manifest.json：記錄每個切片的處理結果
+
+    每個切片完成（或失敗）就立即寫入，程序中途終止後重新執行同一個 workspace 時，
+    音訊內容相同且已完成的切片會直接讀回結果，只重跑失敗或缺少的切片。
+    """
+    
+    def __init__(self, workspace_path: str):
+        self.path = os.path.join(workspace_path, "manifest.json")
+        self.lock = threading.Lock()
+        self.data = {"slices": {}}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ manifest 讀取失敗，將重新建立: {e}")
+    
+    def completed(self, slice_name: str, audio_hash: str) -> Optional[Dict[str, Any]]:
+        """回傳已完成且音訊內容相同的切片紀錄"""
+        entry = self.data["slices"].get(slice_name)
+        if entry and entry.get("status") == "done" and entry.get("audio_hash") == audio_hash:
+            return entry
+        return None
+    
+    def record(self, slice_name: str, entry: Dict[str, Any]):
+        with self.lock:
+            entry["updated_at"] = time.time()
+            self.data["slices"][slice_name] = entry
+            write_text_atomic(self.path, json.dumps(self.data, ensure_ascii=False, indent=2))
+
+# 視為暫時性、可以重試的 HTTP 狀態碼與網路錯誤
+TRANSIENT_STATUS_CODES = {408, 500, 502, 503, 504}
+@functools.lru_cache(maxsize=None)
+def transient_network_errors() -> tuple:
+    """視為暫時性的網路錯誤類型（第一次發生錯誤時才載入 httpx / aiohttp）"""
+    errors = (asyncio.TimeoutError, ConnectionError, httpx.TimeoutException, httpx.TransportError)
+    if aiohttp is not None:
+        errors += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+    return errors
+
+class WorkspaceManager:
+    """
+    管理 audio/<key>/（原始音檔）與 workspace/<key>/（切片、逐字稿、摘要）的生命週期
+
+    上傳依內容雜湊、YouTube 依影片 id 決定 key，同名但內容不同的檔案不會寫進同一個目錄；
+    內容相同時沿用同一個 workspace，manifest 的斷點續跑仍然有效。每次工作結束後做垃圾回收：
+    超過 ttl 未使用的 key 直接刪除，總大小超過 max_bytes 時依最後使用時間由舊到新刪除（LRU）。
+    執行中工作使用的 key 不會被刪除，且同一時間只允許一個工作使用。
+    """
+    
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+        # key -> 使用中的 job_id
+        self.in_use: Dict[str, Optional[str]] = {}
+    
+    @property
+    def roots(self) -> List[str]:
+        return [os.path.join(pwd, "audio"), os.path.join(pwd, "workspace")]
+    
+    def audio_dir(self, key: str) -> str:
+        path = os.path.join(pwd, "audio", key)
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    def workspace_dir(self, key: str) -> str:
+        return os.path.join(pwd, "workspace", key)
+    
+    def key_for(self, file_path: str, file_name: str) -> str:
+        """audio/<key>/<file_name> 的 key；舊版直接放在 audio/ 下的檔案以檔名作為 key"""
+        parent = os.path.dirname(os.path.abspath(file_path))
+        if os.path.dirname(parent) == os.path.abspath(os.path.join(pwd, "audio")):
+            return os.path.basename(parent)
+        return file_name
+    
+    def acquire(self, key: str, job_id: Optional[str] = None):
+        """
+        獨佔 key（不會被回收），並更新最後使用時間
+
+        兩個 pipeline 共用同一個 workspace 會互相覆寫切片與 manifest，例如取消後仍在收尾的工作
+        與重新送出的相同內容；後來的工作在這裡等前一個釋放，等待期間仍會檢查取消與期限。
+        """
+        with self.released:
+            if key in self.in_use:
+                print(f"⏳ workspace {key} 仍由工作 {self.in_use[key]} 使用，等待釋放")
+            while key in self.in_use:
+                self.released.wait(timeout=1.0)
+                raise_if_cancelled(job_id)
+            self.in_use[key] = job_id
+        for root in self.roots:
+            try:
+                os.utime(os.path.join(root, key))
+            except FileNotFoundError:
+                pass
+    
+    def release(self, key: str):
+        with self.released:
+            del self.in_use[key]
+            self.released.notify_all()
+        self.collect()
+    
+    def _scan(self) -> Dict[str, list]:
+        """回傳 {key: [最後使用時間, 大小, [路徑...]]}，audio/ 與 workspace/ 中同名的項目合併計算"""
+        entries = {}
+        for root in self.roots:
+            try:
+                names = os.listdir(root)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                size = stat.st_size
+                if os.path.isdir(path):
+                    for dir_root, _, files in os.walk(path):
+                        for file in files:
+                            try:
+                                size += os.path.getsize(os.path.join(dir_root, file))
+                            except FileNotFoundError:
+                                pass
+                entry = entries.setdefault(name, [0.0, 0, []])
+                entry[0] = max(entry[0], stat.st_mtime)
+                entry[1] += size
+                entry[2].append(path)
+        return entries
+    
+    def _remove(self, paths: List[str]):
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+    
+    def discard(self, key: str):
+        """刪除還沒有任何工作處理過的 key（例如上傳完成後工作被拒絕），不必等到 TTL 才回收"""
+        with self.lock:
+            if key in self.in_use or os.path.exists(self.workspace_dir(key)):
+                return
+            self._remove([os.path.join(pwd, "audio", key)])
+    
+    def collect(self):
+        """刪除逾時的 key，總大小仍超過上限時再依 LRU 刪到上限的 90%"""
+        with self.lock:
+            in_use = set(self.in_use)
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries.values())
+            over_budget = total > self.max_bytes
+            now = time.time()
+            removed = {"ttl": 0, "size": 0}
+            
+            candidates = sorted(
+                (last_used, key) for key, (last_used, _, _) in entries.items() if key not in in_use
+            )
+            for last_used, key in candidates:
+                _, size, paths = entries[key]
+                if self.ttl_seconds > 0 and now - last_used > self.ttl_seconds:
+                    reason = "ttl"
+                elif over_budget and total > self.max_bytes * 0.9 and not key.startswith("."):
+                    # 以 "." 開頭的是上傳中的暫存檔，只在逾時（上傳中斷遺留）時回收
+                    reason = "size"
+                else:
+                    continue
+                self._remove(paths)
+                total -= size
+                removed[reason] += 1
+                WORKSPACE_EVICTIONS.labels(reason).inc()
+            
+            WORKSPACE_BYTES.set(total)
+        if removed["ttl"] or removed["size"]:
+            print(
+                f"🧹 工作目錄清理：逾時 {removed['ttl']} 個、超過容量 {removed['size']} 個，"
+                f"目前 {total / 1024 / 1024:.1f} MB"
+            )
+
+workspace_manager = WorkspaceManager(WORKSPACE_MAX_BYTES, WORKSPACE_TTL_HOURS * 3600)
+
+class JobDeadlineExceeded(Exception):
+    """工作超過 JOB_DEADLINE_SECONDS，不再等待重試"""
+
+def parse_duration(value: Any) -> Optional[float]:
+    """解析 protobuf Duration 的 JSON 格式（例如 "17s"、"0.5s"）"""
+    if isinstance(value, str) and value.endswith('s'):
+        try:
+            return float(value[:-1])
+        except ValueError:
+            return None
+    return None
+
+def parse_retry_delay(error_dict: Any) -> Optional[float]:
+    """從錯誤響應的 RetryInfo 解析 retryDelay；沒有提供時回傳 None"""
+    if not isinstance(error_dict, dict):
+        return None
+    details = error_dict.get('error', error_dict).get('details') or []
+    for detail in details:
+        if isinstance(detail, dict) and detail.get('@type') == 'type.googleapis.com/google.rpc.RetryInfo':
+            return parse_duration(detail.get('retryDelay'))
+    return None
+
+def classify_api_error(e: Exception) -> tuple:
+    """
+    依錯誤類型決定重試方式，回傳 (kind, retry_delay)
+
+    kind 為 "quota"（429 / RESOURCE_EXHAUSTED）、"transient"（5xx、逾時、連線中斷）
+    或 "fatal"（不重試）；retry_delay 是伺服器在 RetryInfo 中建議的等待秒數，沒有時為 None。
+    """
+    if isinstance(e, genai_errors.APIError):
+        if e.code == 429 or e.status == "RESOURCE_EXHAUSTED":
+            retry_delay = parse_retry_delay(e.details)
+            if retry_delay is None:
+                # 部分回應只在訊息中附上 "Please retry in 17.3s"
+                match = re.search(r'retry in (\d+(?:\.\d+)?)s', e.message or '', re.IGNORECASE)
+                retry_delay = float(match.group(1)) if match else None
+            return "quota", retry_delay
+        if e.code in TRANSIENT_STATUS_CODES:
+            return "transient", None
+        return "fatal", None
+    if isinstance(e, transient_network_errors()):
+        return "transient", None
+    return "fatal", None
+
+def retry_backoff(attempt: int) -> float:
+    """第 attempt 次重試的等待秒數：指數退避加 full jitter，避免多個請求同時重試"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def quota_backoff(attempt: int) -> float:
+    """
+    429 沒有 retryDelay 時的冷卻秒數：至少 QUOTA_RETRY_BASE_DELAY，每次加倍，上限為一個額度時間窗
+
+    額度以每分鐘計算，太短的冷卻只會在同一個時間窗內把重試次數用完；只加少量抖動，保留下限。
+    """
+    delay = min(RateLimiter.WINDOW_SECONDS, QUOTA_RETRY_BASE_DELAY * 2 ** attempt)
+    return delay * random.uniform(1.0, 1.1)
+
+async def api_call_with_retry_async(func, *args, max_retries=5, model=None, request_type=None,
+                                    job_id=None, **kwargs):
+    """
+    帶重試邏輯的 API 調用包裝器，每次嘗試前先取得 model / request_type 的額度
+
+    429 時依伺服器的 retryDelay（沒有時用 quota_backoff）設定共用冷卻，所有共用該額度的請求
+    一起暫停；5xx 與網路錯誤只有這個請求以指數退避重試。等待會超過工作期限時直接放棄。
+    """
+    label = request_type or "other"
+    
+    for attempt in range(max_retries + 1):
+        await rate_limiter.wait_if_needed_async(model, request_type)
+        raise_if_cancelled(job_id)
+        try:
+            result = await func(*args, **kwargs)
+            genai_client_pool.report(network_error=False)
+            GEMINI_REQUESTS.labels(label, "ok").inc()
+            record_token_usage(label, getattr(result, "usage_metadata", None))
+            return result
             
         except Exception as e:
-            error_str = str(e)
+            kind, retry_delay = classify_api_error(e)
+            genai_client_pool.report(network_error=isinstance(e, transient_network_errors()))
+            GEMINI_REQUESTS.labels(label, "quota_error" if kind == "quota" else "error").inc()
+            if kind == "fatal":
+                print(f"❌ 遇到無法重試的錯誤: {e}")
+                raise
+            if attempt == max_retries:
+                print(f"❌ 已達到最大重試次數 ({max_retries})，放棄請求")
+                raise
+            
+            if retry_delay is None:
+                retry_delay = quota_backoff(attempt) if kind == "quota" else retry_backoff(attempt)
+            remaining = job_time_remaining(job_id)
+            if remaining is not None and retry_delay >= remaining:
+                expire_job_deadline(job_id)
+                raise JobDeadlineExceeded(
+                    f"工作剩餘 {remaining:.0f} 秒，不足以等待 {retry_delay:.1f} 秒後重試: {e}"
+                ) from e
             
-            if '429' in error_str or 'RESOURCE_EXHAUSTED' in error_str or 'quota' in error_str.lower():
-                retry_count += 1
-                
-                if retry_count > max_retries:
-                    print(f"❌ 已達到最大重試次數 ({max_retries})，放棄請求")
-                    raise
-                
-                retry_delay = 60.0
-                
-                if hasattr(e, 'details') and isinstance(e.details, str):
-                    try:
-                        import json
-                        error_dict = json.loads(e.details)
-                        retry_delay = parse_retry_delay(error_dict)
-                    except:
-                        pass
-                
-                if retry_delay == 60.0 and 'retry in' in error_str.lower():
-                    try:
-                        match = re.search(r'retry in (\d+(?:\.\d+)?)s', error_str, re.IGNORECASE)
-                        if match:
-                            retry_delay = float(match.group(1))
-                    except:
-                        pass
-                
-                print(f"⚠️ 遇到配額限制錯誤 (重試 {retry_count}/{max_retries})")
-                print(f"⏳ 等待 {retry_delay:.1f} 秒後重試...")
-                time.sleep(retry_delay + 1)
-                
+            GEMINI_RETRIES.labels(label).inc()
+            GEMINI_BACKOFF_SECONDS.labels(label).observe(retry_delay)
+            if kind == "quota":
+                # 冷卻由速率限制器共用，下一輪取得額度時一併等待
+                print(f"⚠️ 遇到配額限制 (重試 {attempt + 1}/{max_retries})，{label} 額度冷卻 {retry_delay:.1f} 秒")
+                rate_limiter.cooldown(retry_delay, model, request_type)
             else:
-                print(f"❌ 遇到非配額錯誤: {error_str}")
-                raise
+                print(f"⚠️ 遇到暫時性錯誤 (重試 {attempt + 1}/{max_retries})，{retry_delay:.1f} 秒後重試: {e}")
+                await asyncio.sleep(retry_delay)
+
+def new_genai_client() -> genai.Client:
+    """建立獨立的 Gemini client；設定 GEMINI_BASE_URL 時改連到該位址"""
+    if GEMINI_BASE_URL:
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(base_url=GEMINI_BASE_URL))
+    return genai.Client(api_key=api_key)
+
+def create_genai_client() -> genai.Client:
+    """在事件迴圈中取得該迴圈共用的 client；不在事件迴圈中時建立獨立的 client"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return new_genai_client()
+    return genai_client_pool.get()
+
+class GenaiClientPool:
+    """
+    每個執行緒一個長駐的事件迴圈與 genai.Client，跨切片、跨工作共用 keep-alive 連線
+
+    google-genai 的非同步連線池綁在事件迴圈上，每次 asyncio.run 都會建立新的迴圈與連線池、
+    重新做 TCP / TLS 握手。run() 讓同一個執行緒重複使用自己的事件迴圈，get() 依事件迴圈
+    快取 client，連線數上限為 pool_size。取用時做健康檢查：連線池已關閉、使用超過 max_age 秒，
+    或連續發生 max_errors 次網路錯誤的 client 會被重建。
+    """
+    
+    def __init__(self, pool_size: int, keepalive_seconds: float, max_age: float, max_errors: int):
+        self.pool_size = pool_size
+        self.keepalive_seconds = keepalive_seconds
+        self.max_age = max_age
+        self.max_errors = max_errors
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # event loop -> {"client", "session", "created_at", "errors"}
+        self.entries: Dict[Any, Dict[str, Any]] = {}
+        self.ssl_context = None
+        # 關閉中的連線池；run() 結束時會等它們完成，不與其他剩餘工作一起取消
+        self.closing = set()
+    
+    def run(self, coro):
+        """在目前執行緒的長駐事件迴圈中執行 coroutine"""
+        loop = getattr(self.local, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            self.local.loop = loop
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            # 與 asyncio.run 相同，取消這次留下的工作；事件迴圈與連線池留給下一次使用
+            pending = asyncio.all_tasks(loop)
+            for task in pending - self.closing:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            asyncio.set_event_loop(None)
     
-    raise Exception(f"API 調用失敗，已重試 {max_retries} 次")
+    def close_thread_loop(self):
+        """關閉目前執行緒的事件迴圈與其 client（執行緒即將結束時使用）"""
+        loop = getattr(self.local, "loop", None)
+        if loop is None:
+            return
+        with self.lock:
+            entry = self.entries.pop(loop, None)
+        if entry is not None:
+            loop.run_until_complete(self._close(entry))
+        loop.close()
+        self.local.loop = None
+    
+    def get(self) -> genai.Client:
+        """取得目前事件迴圈的 client，不健康時重建"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            # 已關閉的事件迴圈上的連線無法再使用，也無法正常關閉，直接丟棄
+            for closed_loop in [l for l in self.entries if l.is_closed()]:
+                del self.entries[closed_loop]
+            
+            entry = self.entries.get(loop)
+            reason = "new" if entry is None else self._unhealthy(entry)
+            if reason is None:
+                return entry["client"]
+            
+            if entry is not None:
+                print(f"♻️ 重建 Gemini client（{reason}）")
+                self._close_later(entry)
+            entry = self._build()
+            self.entries[loop] = entry
+            GEMINI_CLIENTS_CREATED.labels(reason).inc()
+            return entry["client"]
+    
+    def report(self, network_error: bool):
+        """api_call_with_retry_async 回報請求結果，用來計算連續網路錯誤次數"""
+        try:
+            entry = self.entries.get(asyncio.get_running_loop())
+        except RuntimeError:
+            return
+        if entry is not None:
+            entry["errors"] = entry["errors"] + 1 if network_error else 0
+    
+    def _unhealthy(self, entry: Dict[str, Any]) -> Optional[str]:
+        session = entry["session"]
+        if getattr(session, "closed", False) or getattr(session, "is_closed", False):
+            return "closed"
+        if self.max_age > 0 and time.time() - entry["created_at"] > self.max_age:
+            return "max_age"
+        if entry["errors"] >= self.max_errors:
+            return "errors"
+        return None
+    
+    def _build(self) -> Dict[str, Any]:
+        if self.ssl_context is None:
+            # 與 google-genai 相同的 CA 設定
+            self.ssl_context = ssl.create_default_context(cafile=os.environ.get("SSL_CERT_FILE", certifi.where()))
+        
+        options = {"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else {}
+        # HttpOptions 不接受未知欄位：aiohttp_client 自 google-genai 1.58、httpx_async_client 自 1.46 起才有
+        supported = types.HttpOptions.model_fields
+        if aiohttp is not None and "aiohttp_client" in supported:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=self.keepalive_seconds, ssl=self.ssl_context
+            )
+            session = aiohttp.ClientSession(connector=connector, trust_env=True)
+            options["aiohttp_client"] = session
+        elif "httpx_async_client" in supported:
+            limits = httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_seconds,
+            )
+            session = httpx.AsyncClient(limits=limits, verify=self.ssl_context, trust_env=True)
+            options["httpx_async_client"] = session
+        else:
+            # 舊版 google-genai 無法傳入自訂連線池，退回由 client 自行管理連線
+            return {"client": new_genai_client(), "session": None, "created_at": time.time(), "errors": 0}
+        
+        entry = {"client": None, "session": session, "created_at": time.time(), "errors": 0}
+        try:
+            entry["client"] = genai.Client(api_key=api_key, http_options=types.HttpOptions(**options))
+        except Exception:
+            # 例如沒有設定 GEMINI_API_KEY：關閉剛建立的連線池，避免每個失敗的工作都留下一個
+            self._close_later(entry)
+            raise
+        return entry
+    
+    def _close_later(self, entry: Dict[str, Any]):
+        """在目前的事件迴圈中關閉 entry 的連線池（呼叫端是同步程式碼，無法直接 await）"""
+        task = asyncio.get_running_loop().create_task(self._close(entry))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+    
+    @staticmethod
+    async def _close(entry: Dict[str, Any]):
+        session = entry["session"]
+        if session is None:
+            return
+        try:
+            await (session.aclose() if hasattr(session, "aclose") else session.close())
+        except Exception as e:
+            print(f"⚠️ 關閉 Gemini 連線池失敗: {e}")
+
+genai_client_pool = GenaiClientPool(
+    GEMINI_POOL_SIZE, GEMINI_KEEPALIVE_SECONDS, GEMINI_CLIENT_MAX_AGE, GEMINI_CLIENT_MAX_ERRORS
+)
+
+class FileActivationWatcher:
+    """
+    集中等待多個上傳中的檔案變成 ACTIVE
+
+    所有等待中的檔案由同一個背景工作輪詢：每個檔案有自己的下次檢查時間
+    （指數退避 + 隨機抖動），同時到期的檔案合併成一批檢查；數量夠多時用一次
+    files.list 取得所有狀態，不再每個檔案每秒呼叫一次 files.get。
+    """
+    
+    def __init__(self, audio_client: genai.Client):
+        self.audio_client = audio_client
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.poll_task = None
+        # 有新檔案加入時喚醒輪詢，不必等到其他檔案的退避時間結束
+        self.wakeup = asyncio.Event()
+        self.stats = {"files": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "status_calls": 0}
+    
+    async def wait_active(self, myfile):
+        """等待檔案變成 ACTIVE 並回傳最新的檔案物件"""
+        started_at = time.time()
+        if myfile.state != "ACTIVE":
+            future = asyncio.get_running_loop().create_future()
+            self.pending[myfile.name] = {
+                "future": future,
+                "delay": FILE_ACTIVATION_INITIAL_DELAY,
+                "next_check": started_at + self._jitter(FILE_ACTIVATION_INITIAL_DELAY),
+            }
+            self.wakeup.set()
+            if self.poll_task is None or self.poll_task.done():
+                self.poll_task = asyncio.create_task(self._poll_loop())
+            try:
+                myfile = await asyncio.wait_for(future, timeout=FILE_ACTIVATION_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise Exception(f"檔案上傳失敗，等待 {FILE_ACTIVATION_TIMEOUT:.0f} 秒後仍未變成 ACTIVE")
+            finally:
+                self.pending.pop(myfile.name, None)
+        
+        waited = time.time() - started_at
+        self.stats["files"] += 1
+        self.stats["wait_seconds"] += waited
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        return myfile
+    
+    @staticmethod
+    def _jitter(delay: float) -> float:
+        return delay * random.uniform(0.8, 1.2)
+    
+    async def _poll_loop(self):
+        while self.pending:
+            self.wakeup.clear()
+            # 已有結果的檔案在等待端取走前仍留在 pending，不再查詢；之後有新檔案時 wait_active 會重新啟動輪詢
+            waiting = [entry for entry in self.pending.values() if not entry["future"].done()]
+            if not waiting:
+                break
+            next_check = min(entry["next_check"] for entry in waiting)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=max(0.0, next_check - time.time()))
+            except asyncio.TimeoutError:
+                pass
+            
+            now = time.time()
+            due = [
+                name for name, entry in self.pending.items()
+                if not entry["future"].done() and entry["next_check"] <= now
+            ]
+            if not due:
+                continue
+            
+            try:
+                states = await self._fetch(due)
+            except Exception as e:
+                print(f"⚠️ 查詢檔案狀態失敗: {e}")
+                states = {}
+            
+            for name in due:
+                entry = self.pending.get(name)
+                if entry is None or entry["future"].done():
+                    continue
+                myfile = states.get(name)
+                if myfile is not None and myfile.state == "ACTIVE":
+                    entry["future"].set_result(myfile)
+                elif myfile is not None and myfile.state == "FAILED":
+                    entry["future"].set_exception(Exception(f"檔案上傳失敗，狀態: {myfile.state}"))
+                else:
+                    entry["delay"] = min(entry["delay"] * FILE_ACTIVATION_BACKOFF, FILE_ACTIVATION_MAX_DELAY)
+                    entry["next_check"] = time.time() + self._jitter(entry["delay"])
+    
+    async def _fetch(self, names: List[str]) -> Dict[str, Any]:
+        """取得 names 的最新狀態：數量多時用 files.list，否則並行 files.get"""
+        states = {}
+        if len(names) >= FILE_ACTIVATION_LIST_THRESHOLD:
+            wanted = set(names)
+            self.stats["status_calls"] += 1
+            pager = await self.audio_client.aio.files.list(config={"page_size": 100})
+            async for myfile in pager:
+                if myfile.name in wanted:
+                    states[myfile.name] = myfile
+                    if len(states) == len(wanted):
+                        break
+        
+        missing = [name for name in names if name not in states]
+        if missing:
+            self.stats["status_calls"] += len(missing)
+            files = await asyncio.gather(
+                *(self.audio_client.aio.files.get(name=name) for name in missing),
+                return_exceptions=True,
+            )
+            for name, myfile in zip(missing, files):
+                if not isinstance(myfile, Exception):
+                    states[name] = myfile
+        return states
+    
+    def report(self):
+        if self.stats["files"]:
+            avg = self.stats["wait_seconds"] / self.stats["files"]
+            print(
+                f"⏱️ 檔案啟用等待：{self.stats['files']} 個檔案，平均 {avg:.2f} 秒，"
+                f"最長 {self.stats['max_wait_seconds']:.2f} 秒，狀態查詢 {self.stats['status_calls']} 次"
+            )
+
+def run_async(coro):
+    """
+    在同步程式碼中執行 coroutine，使用目前執行緒的長駐事件迴圈（保留 Gemini 連線池）
+
+    若目前執行緒已有執行中的事件迴圈，改在新執行緒中執行，結束時關閉該執行緒的迴圈與連線。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return genai_client_pool.run(coro)
+    
+    result = {}
+    def runner():
+        try:
+            result['value'] = genai_client_pool.run(coro)
+        except BaseException as e:
+            result['error'] = e
+        finally:
+            genai_client_pool.close_thread_loop()
+    
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
 
 def sanitize_filename(filename: str) -> str:
     """清理檔名，移除不合法字元"""
@@ -164,6 +1257,21 @@ def sanitize_filename(filename: str) -> str:
         filename = filename[:200]
     return filename
 
+def parse_abr(abr: Optional[str]) -> int:
+    """'48kbps' -> 48"""
+    match = re.match(r"(\d+)", abr or "")
+    return int(match.group(1)) if match else 0
+
+def choose_audio_stream(streams):
+    """挑選位元率 >= YOUTUBE_MIN_ABR_KBPS 中最小的音訊串流；都不夠時退回位元率最高者"""
+    audio_streams = [stream for stream in streams.filter(only_audio=True) if parse_abr(stream.abr)]
+    if not audio_streams:
+        return None
+    adequate = [stream for stream in audio_streams if parse_abr(stream.abr) >= YOUTUBE_MIN_ABR_KBPS]
+    if adequate:
+        return min(adequate, key=lambda stream: parse_abr(stream.abr))
+    return max(audio_streams, key=lambda stream: parse_abr(stream.abr))
+
 def download_youtube_audio(youtube_url: str) -> tuple[str, str]:
     """
     從 YouTube 下載純音訊檔案
@@ -173,48 +1281,44 @@ def download_youtube_audio(youtube_url: str) -> tuple[str, str]:
     try:
         print(f"📺 開始下載 YouTube 影片: {youtube_url}")
         
+        # 每支影片使用自己的 audio/yt_<video_id>/ 目錄
+        video_id = extract.video_id(youtube_url)
+        audio_dir = workspace_manager.audio_dir(f"yt_{video_id}")
+        
+        # 同一支影片下載過就直接使用快取
+        cached_path = result_cache.get_path("youtube", video_id)
+        if cached_path is not None:
+            file_name = os.path.basename(cached_path)
+            final_path = os.path.join(audio_dir, file_name)
+            link_or_copy(cached_path, final_path)
+            print(f"♻️ 使用快取的 YouTube 音訊: {file_name}")
+            return final_path, file_name
+        
         # 建立 YouTube 物件
-        yt = YouTube(youtube_url, on_progress_callback=on_progress)
+        yt = pytubefix.YouTube(youtube_url, on_progress_callback=pytubefix_cli.on_progress)
         
         # 取得影片資訊
         video_title = sanitize_filename(yt.title)
         print(f"📹 影片標題: {yt.title}")
         print(f"⏱️ 影片長度: {yt.length} 秒")
         
-        # 確保 audio 目錄存在
-        audio_dir = os.path.join(pwd, "audio")
-        os.makedirs(audio_dir, exist_ok=True)
-        
-        # 取得純音訊串流（最高品質）
-        audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
+        # 取得足夠語音辨識使用的最小音訊串流
+        audio_stream = choose_audio_stream(yt.streams)
         
         if not audio_stream:
             raise Exception("無法找到音訊串流")
         
-        print(f"🎵 音訊品質: {audio_stream.abr}")
+        print(f"🎵 音訊品質: {audio_stream.abr} ({audio_stream.audio_codec})")
         
-        # 下載音訊
+        # 直接保留原始容器（m4a / webm），切片時以 stream copy 取出各段，不需整檔轉成 mp3
+        ext = "m4a" if audio_stream.subtype == "mp4" else audio_stream.subtype
+        file_name = f"yt_{video_title}.{ext}"
         print(f"⬇️ 開始下載音訊...")
-        downloaded_file = audio_stream.download(
-            output_path=audio_dir,
-            filename_prefix="yt_"
-        )
+        final_path = audio_stream.download(output_path=audio_dir, filename=file_name)
+        file_name = os.path.basename(final_path)
         
-        # 重新命名為 .mp3 (如果不是的話)
-        file_name = f"yt_{video_title}.mp3"
-        final_path = os.path.join(audio_dir, file_name)
-        
-        # 如果下載的檔案不是 mp3，進行轉換
-        if not downloaded_file.endswith('.mp3'):
-            print(f"🔄 轉換音訊格式為 MP3...")
-            audio = AudioSegment.from_file(downloaded_file)
-            audio.export(final_path, format="mp3")
-            # 刪除原始檔案
-            os.remove(downloaded_file)
-        else:
-            # 如果已經是 mp3，只需重新命名
-            if downloaded_file != final_path:
-                shutil.move(downloaded_file, final_path)
+        if result_cache.enabled:
+            result_cache.put_file("youtube", video_id, final_path, file_name)
         
         print(f"✅ YouTube 音訊下載完成: {file_name}")
         return final_path, file_name
@@ -224,57 +1328,585 @@ def download_youtube_audio(youtube_url: str) -> tuple[str, str]:
         raise Exception(f"YouTube 下載失敗: {str(e)}")
 
 def create_dir(state: AllState):
-    file_name = state["file_name"]
-    workspace_path = os.path.join(pwd, "workspace", file_name)
-    raw_audio_path = os.path.join(pwd, "audio", file_name)
+    raise_if_cancelled(state.get("job_id"))
+    raw_audio_path = state["raw_audio_path"]
+    workspace_path = workspace_manager.workspace_dir(workspace_manager.key_for(raw_audio_path, state["file_name"]))
 
     os.makedirs(workspace_path, exist_ok=True)
     state["workspace_path"] = workspace_path
-    state["raw_audio_path"] = raw_audio_path
 
     os.makedirs(os.path.join(workspace_path, "slice_audio"), exist_ok=True)
     os.makedirs(os.path.join(workspace_path, "transcript"), exist_ok=True)
+    os.makedirs(os.path.join(workspace_path, "summaries"), exist_ok=True)
     print(f"📁 目錄已建立: {workspace_path}")
     return state
 
-def slice_audio(state: AllState):
-    segment_length = 5 * 60 * 1000  # 5 minutes
-    overlap_length = 20 * 1000      # 20 seconds
+def probe_audio(file_path: str) -> Dict[str, Any]:
+    """用 ffprobe 讀取音檔長度與第一條音軌的編碼，不解碼音訊內容"""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "format=duration:stream=codec_name",
+        "-of", "json",
+        file_path,
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise Exception(f"ffprobe 失敗: {proc.stderr.strip()}")
+
+    info = json.loads(proc.stdout or "{}")
+    streams = info.get("streams") or []
+    if not streams:
+        raise Exception("找不到音訊串流")
+
+    duration = float(info.get("format", {}).get("duration") or 0)
+    return {
+        "duration_ms": int(duration * 1000),
+        "codec": streams[0].get("codec_name", ""),
+    }
+
+def plan_slices(duration_ms: int, segment_length: int = SEGMENT_LENGTH_MS,
+                overlap_length: int = OVERLAP_LENGTH_MS) -> List[tuple]:
+    """計算每個切片的 (start_ms, end_ms)：每段 segment_length，並向後重疊 overlap_length"""
+    if duration_ms <= 0:
+        return []
+    num_segments = math.ceil(duration_ms / segment_length)
+    windows = []
+    for i in range(num_segments):
+        start = i * segment_length
+        end = min(start + segment_length + overlap_length, duration_ms)
+        windows.append((start, end))
+        # 剩下的尾巴已完整落在本段的重疊區內，不必再多切一段
+        if end == duration_ms:
+            break
+    return windows
+
+def silence_detect_command(input_path: str) -> List[str]:
+    """silencedetect 指令：分析前先降為單聲道 8 kHz，只需解碼一次、記憶體固定，不產生輸出檔"""
+    audio_filter = (
+        f"aformat=channel_layouts=mono,aresample={SILENCE_ANALYSIS_SAMPLE_RATE},"
+        f"silencedetect=noise={SILENCE_NOISE_DB:g}dB:d={SILENCE_MIN_DURATION:g}"
+    )
+    return [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", input_path,
+        "-map", "0:a:0", "-af", audio_filter,
+        "-f", "null", "-",
+    ]
 
+def parse_silencedetect(output: str) -> List[tuple]:
+    """解析 silencedetect 的輸出為 [(start_ms, end_ms), ...]"""
+    silences = []
+    start = None
+    for line in output.splitlines():
+        match = re.search(r"silence_start: (-?[\d.]+)", line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = re.search(r"silence_end: ([\d.]+)", line)
+        if match and start is not None:
+            silences.append((int(start * 1000), int(float(match.group(1)) * 1000)))
+            start = None
+    if start is not None:
+        # 檔案以靜音結尾時沒有 silence_end
+        silences.append((int(start * 1000), None))
+    return silences
+
+def detect_silences(file_path: str) -> List[tuple]:
+    """用 ffmpeg silencedetect 找出靜音區段 [(start_ms, end_ms), ...]"""
+    proc = subprocess.run(silence_detect_command(file_path), capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise Exception(f"靜音偵測失敗: {proc.stderr.strip()[-500:]}")
+    return parse_silencedetect(proc.stderr)
+
+def silence_sidecar_key(file_path: str) -> Dict[str, Any]:
+    return {
+        "size": os.path.getsize(file_path),
+        "noise_db": SILENCE_NOISE_DB,
+        "min_duration": SILENCE_MIN_DURATION,
+        "sample_rate": SILENCE_ANALYSIS_SAMPLE_RATE,
+    }
+
+def save_silences(file_path: str, silences: List[tuple]):
+    """把靜音分析結果存在音檔旁（<file>.silences.json），同一個檔案不必再分析一次"""
+    payload = {"key": silence_sidecar_key(file_path), "silences": silences}
+    write_text_atomic(f"{file_path}.silences.json", json.dumps(payload))
+
+def get_silences(file_path: str) -> List[tuple]:
+    """優先使用上傳時的靜音分析（仍在進行時等它完成），否則現在分析並存檔"""
+    pending = pending_silence_analyses.get(file_path)
+    if pending is not None:
+        print("⏳ 等待上傳時開始的靜音分析完成...")
+        pending.wait()
+    try:
+        with open(f"{file_path}.silences.json", "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("key") == silence_sidecar_key(file_path):
+            return [tuple(silence) for silence in saved["silences"]]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    silences = detect_silences(file_path)
+    save_silences(file_path, silences)
+    return silences
+
+def adaptive_segment_length(duration_ms: int) -> int:
+    """
+    依並行數與目前剩餘的速率額度決定目標切片長度
+
+    額度能同時容納的切片越多，切得越細以提高並行度；額度緊張時改切成較少、較長的切片，
+    減少請求數。結果限制在 ADAPTIVE_MIN_SEGMENT_MS ~ ADAPTIVE_MAX_SEGMENT_MS 之間。
+    """
+    # 每個切片的模型請求數：轉錄 + 摘要，合併模式只需一次
+    model_requests = 1 if COMBINED_MODE else 2
+    budgets = [MAP_CONCURRENCY]
+    model_free = rate_limiter.available(model=GEMINI_MODEL)
+    if model_free is not None:
+        budgets.append(model_free // model_requests)
+    transcribe_free = rate_limiter.available(request_type="transcribe")
+    if transcribe_free is not None:
+        budgets.append(transcribe_free)
+
+    most = math.ceil(duration_ms / ADAPTIVE_MIN_SEGMENT_MS)
+    fewest = math.ceil(duration_ms / ADAPTIVE_MAX_SEGMENT_MS)
+    num_segments = max(1, fewest, min(most, *budgets))
+    return max(ADAPTIVE_MIN_SEGMENT_MS, math.ceil(duration_ms / num_segments))
+
+def plan_slices_adaptive(duration_ms: int, silences: List[tuple], segment_length: int,
+                         overlap_length: int = OVERLAP_LENGTH_MS) -> List[tuple]:
+    """
+    在每個目標切點附近挑最長的靜音，從靜音中點下刀，前後切片不重疊；
+    附近沒有靜音時退回固定切點並保留 overlap_length 的重疊
+    """
+    if duration_ms <= 0:
+        return []
+    tolerance = int(segment_length * SILENCE_SEARCH_RATIO)
+    midpoints = [
+        ((start + (end if end is not None else duration_ms)) // 2,
+         (end if end is not None else duration_ms) - start)
+        for start, end in silences
+    ]
+
+    windows = []
+    start = 0
+    while True:
+        # 剩下的長度在容許範圍內就整段收尾，避免產生很短的尾巴
+        if duration_ms - start <= segment_length + tolerance:
+            windows.append((start, duration_ms))
+            return windows
+
+        target = start + segment_length
+        candidates = [
+            (length, -abs(mid - target), mid)
+            for mid, length in midpoints
+            if target - tolerance <= mid <= target + tolerance
+        ]
+        if candidates:
+            cut = max(candidates)[2]
+            windows.append((start, cut))
+            start = cut
+        else:
+            windows.append((start, min(target + overlap_length, duration_ms)))
+            start = target
+
+def plan_windows(file_path: str, duration_ms: int, slice_dir: str) -> List[tuple]:
+    """
+    依 SLICE_STRATEGY 規劃切片範圍
+
+    規劃結果寫入 slice_dir/slice_plan.json，同一個 workspace 重跑時沿用相同切點，
+    manifest 中已完成的切片才能對得上（額度變化不會讓切點跟著改變）。
+    """
+    plan_path = os.path.join(slice_dir, "slice_plan.json")
+    plan_key = {
+        "strategy": SLICE_STRATEGY,
+        "duration_ms": duration_ms,
+        "size": os.path.getsize(file_path),
+    }
+    try:
+        with open(plan_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("key") == plan_key:
+            print(f"🔪 沿用先前的切片規劃（{len(saved['windows'])} 個片段）")
+            return [tuple(window) for window in saved["windows"]]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    if SLICE_STRATEGY == "adaptive":
+        segment_length = adaptive_segment_length(duration_ms)
+        try:
+            started_at = time.time()
+            with PIPELINE_STAGE_SECONDS.labels("silence_detect").time():
+                silences = get_silences(file_path)
+            windows = plan_slices_adaptive(duration_ms, silences, segment_length)
+            silence_cuts = sum(1 for prev, cur in zip(windows, windows[1:]) if prev[1] == cur[0])
+            print(
+                f"🎯 自適應切片：目標 {segment_length / 60000:.1f} 分鐘/片，偵測到 {len(silences)} 段靜音"
+                f"（{time.time() - started_at:.1f} 秒），{silence_cuts}/{len(windows) - 1} 個切點落在靜音處"
+            )
+        except Exception as e:
+            print(f"⚠️ {e}，改用固定長度切片")
+            windows = plan_slices(duration_ms)
+    else:
+        windows = plan_slices(duration_ms)
+
+    write_text_atomic(plan_path, json.dumps({"key": plan_key, "windows": windows}))
+    return windows
+
+def export_slice_ffmpeg(file_path: str, output_path: str, start_ms: int, end_ms: int, copy: bool) -> str:
+    """用 ffmpeg seek 到 start_ms，只處理 [start_ms, end_ms) 這一段"""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-ss", f"{start_ms / 1000:.3f}",
+        "-i", file_path,
+        "-t", f"{(end_ms - start_ms) / 1000:.3f}",
+        "-map", "0:a:0",
+    ]
+    if copy:
+        cmd += ["-c", "copy"]
+    else:
+        cmd += ["-c:a", "libmp3lame"]
+    cmd.append(output_path)
+
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise Exception(f"ffmpeg 切片失敗 ({os.path.basename(output_path)}): {proc.stderr.strip()}")
+    return output_path
+
+def _star_export(job: tuple) -> str:
+    export_fn, args = job
+    return export_fn(*args)
+
+def iter_export_slices(export_fn, jobs: List[tuple]):
+    """並行執行切片匯出，依 jobs 順序逐一 yield 已完成的切片路徑"""
+    workers = max(1, min(SLICE_WORKERS, len(jobs)))
+    if workers == 1:
+        for job in jobs:
+            yield export_fn(*job)
+        return
+
+    # 實際編碼在 ffmpeg 子進程中進行，執行緒只負責等待，不需再 fork Python 進程
+    with ThreadPool(processes=workers) as pool:
+        yield from pool.imap(_star_export, [(export_fn, job) for job in jobs])
+
+def iter_slices_ffmpeg(file_path: str, slice_dir: str):
+    """串流切片：每段只 seek + 複製對應範圍，不把整個檔案解碼進記憶體"""
+    info = probe_audio(file_path)
+    duration_ms = info["duration_ms"]
+    if duration_ms == 0:
+        print("⚠️ 警告：音檔長度為 0，將不進行切片。")
+        return
+
+    # 來源編碼可直接放進切片容器時用 stream copy，否則只轉碼該段範圍
+    ext = STREAM_COPY_CONTAINERS.get(info["codec"])
+    copy = ext is not None
+    if not copy:
+        ext = ".mp3"
+
+    windows = plan_windows(file_path, duration_ms, slice_dir)
+    mode = "stream copy" if copy else "轉碼為 mp3"
+    print(f"🔪 音檔總長度: {duration_ms / 1000:.2f} 秒 ({info['codec']})，將切分為 {len(windows)} 個片段（{mode}）。")
+
+    jobs = [
+        (file_path, os.path.join(slice_dir, f"part_{i}{ext}"), start, end, copy)
+        for i, (start, end) in enumerate(windows)
+    ]
+    yield from iter_export_slices(export_slice_ffmpeg, jobs)
+
+def slice_audio_ffmpeg(file_path: str, slice_dir: str) -> List[str]:
+    return list(iter_slices_ffmpeg(file_path, slice_dir))
+
+def export_segment_pydub(audio: AudioSegment, start_ms: int, end_ms: int, output_path: str) -> str:
+    audio[start_ms:end_ms].export(output_path, format="mp3")
+    return output_path
+
+def iter_slices_pydub(file_path: str, slice_dir: str):
+    """舊版切片：整檔解碼後重新編碼各段（保留作為對照與備援）"""
+    audio = AudioSegment.from_file(file_path)
+
+    if len(audio) == 0:
+        print("⚠️ 警告：音檔長度為 0，將不進行切片。")
+        return
+
+    windows = plan_windows(file_path, len(audio), slice_dir)
+    print(f"🔪 音檔總長度: {len(audio) / 1000:.2f} 秒，將切分為 {len(windows)} 個片段。")
+
+    jobs = [
+        (audio, start, end, os.path.join(slice_dir, f"part_{i}.mp3"))
+        for i, (start, end) in enumerate(windows)
+    ]
+    yield from iter_export_slices(export_segment_pydub, jobs)
+
+def slice_audio_pydub(file_path: str, slice_dir: str) -> List[str]:
+    return list(iter_slices_pydub(file_path, slice_dir))
+
+def iter_slices(state: AllState):
+    """依 SLICE_ENGINE 逐一產生切片路徑，每產生一個就送出 slice_ready 事件"""
     file_path = state["raw_audio_path"]
-    workspace_path = state["workspace_path"]
-    slice_dir = os.path.join(workspace_path, "slice_audio")
+    slice_dir = os.path.join(state["workspace_path"], "slice_audio")
 
     print(f"🔪 正在讀取音檔: {file_path}")
+    emit_event(state.get("job_id"), "slicing", file_name=state.get("file_name"))
+    if SLICE_ENGINE == "pydub":
+        slices = iter_slices_pydub(file_path, slice_dir)
+    else:
+        slices = iter_slices_ffmpeg(file_path, slice_dir)
+
+    total = None
+    started_at = time.time()
+    for index, path in enumerate(slices):
+        if total is None:
+            total = len(load_slice_plan(slice_dir) or [])
+        emit_event(state.get("job_id"), "slice_ready", slice_name=os.path.basename(path), index=index, total=total)
+        yield path
+    # streaming 模式下切片包含在 slice_and_map 節點內，另外記錄切片本身花的時間
+    PIPELINE_STAGE_SECONDS.labels("slicing").observe(time.time() - started_at)
+
+def slice_audio(state: AllState):
+    file_path = state["raw_audio_path"]
+    slice_dir = os.path.join(state["workspace_path"], "slice_audio")
+
     try:
-        audio = AudioSegment.from_file(file_path)
+        slice_paths = list(iter_slices(state))
     except Exception as e:
         print(f"❌ 載入音檔失敗: {file_path}: {e}")
         raise
+
+    state["slice_paths"] = slice_paths
+    if slice_paths:
+        print(f"🔪 切片完成，已儲存至 {slice_dir}")
+    return state
+
+def choose_transport(slice_file_path: str) -> str:
+    """依 TRANSPORT_MODE 與切片大小決定 inline 或 upload"""
+    size = os.path.getsize(slice_file_path)
+    if TRANSPORT_MODE == "upload":
+        return "upload"
+    if TRANSPORT_MODE == "inline":
+        return "inline" if size <= INLINE_HARD_LIMIT_BYTES else "upload"
+    return "inline" if size <= INLINE_MAX_BYTES else "upload"
+
+def read_file_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+async def delete_uploaded_file(audio_client: genai.Client, myfile):
+    """用完即刪除上傳的檔案，避免在專案的檔案空間中累積"""
+    try:
+        await audio_client.aio.files.delete(name=myfile.name)
+    except Exception as e:
+        print(f"  > ⚠️ 刪除上傳檔案 {myfile.name} 失敗: {e}")
+
+def parse_combined_response(text: Optional[str]) -> Optional[SliceTranscription]:
+    """解析並驗證 COMBINED_MODE 的 JSON 輸出，格式不符時回傳 None"""
+    if not text:
+        return None
+    try:
+        parsed = SliceTranscription.model_validate_json(text)
+    except (ValidationError, ValueError):
+        return None
+    # 有逐字稿卻沒有摘要時只採用逐字稿，摘要另外生成
+    if parsed.transcript.strip() and not parsed.summary.strip():
+        parsed.summary = ""
+    return parsed
+
+async def transcribe_slice(audio_client: genai.Client, slice_file_path: str, job_id: Optional[str] = None,
+                           watcher: Optional[FileActivationWatcher] = None,
+                           combined: bool = False) -> tuple:
+    """
+    產生切片的逐字稿；小切片直接 inline 傳送，大切片走 Files API 上傳
+
+    回傳 (transcript, summary)。combined=True 時以一次呼叫同時取得兩者，
+    結構化輸出解析失敗時改用一般轉錄，summary 為 None 表示需另外生成。
+    """
+    slice_name = os.path.basename(slice_file_path)
+    transport = choose_transport(slice_file_path)
+    myfile = None
+    
+    try:
+        if transport == "inline":
+            with SLICE_STEP_SECONDS.labels("inline_read").time():
+                data = await asyncio.to_thread(read_file_bytes, slice_file_path)
+            mime_type = SLICE_MIME_TYPES.get(os.path.splitext(slice_file_path)[1], "audio/mp3")
+            audio_part = types.Part.from_bytes(data=data, mime_type=mime_type)
+            SLICE_BYTES_SENT.labels("inline").inc(len(data))
+        else:
+            # 上傳檔案
+            print(f"  > 📤 上傳 {slice_name}...")
+            with SLICE_STEP_SECONDS.labels("upload").time():
+                myfile = await api_call_with_retry_async(
+                    audio_client.aio.files.upload, file=slice_file_path, request_type="upload", job_id=job_id
+                )
+            SLICE_BYTES_SENT.labels("upload").inc(os.path.getsize(slice_file_path))
+            
+            # 等待上傳完成，檔案一變成 ACTIVE 就開始轉錄
+            if watcher is None:
+                watcher = FileActivationWatcher(audio_client)
+            with SLICE_STEP_SECONDS.labels("activation_wait").time():
+                myfile = await watcher.wait_active(myfile)
+            audio_part = myfile
         
-    if len(audio) == 0:
-        print("⚠️ 警告：音檔長度為 0，將不進行切片。")
-        return state
+        raise_if_cancelled(job_id)
+        
+        if combined:
+            print(f"  > 🎤 轉錄並摘要 {slice_name}（{transport}）...")
+            def transcribe_and_summarize():
+                return audio_client.aio.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=[COMBINED_PROMPT, audio_part],
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=SliceTranscription,
+                    )
+                )
+            
+            with SLICE_STEP_SECONDS.labels("transcribe_combined").time():
+                response = await api_call_with_retry_async(
+                    transcribe_and_summarize, model=GEMINI_MODEL, request_type="transcribe", job_id=job_id
+                )
+            parsed = parse_combined_response(response.text)
+            if parsed is not None:
+                return parsed.transcript, (parsed.summary or None)
+            print(f"  > ⚠️ {slice_name} 結構化輸出解析失敗，改用分開的轉錄與摘要")
+            raise_if_cancelled(job_id)
+        
+        # 轉錄
+        print(f"  > 🎤 轉錄 {slice_name}（{transport}）...")
+        def transcribe():
+            return audio_client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=[TRANSCRIBE_PROMPT, audio_part]
+            )
+        
+        with SLICE_STEP_SECONDS.labels("transcribe").time():
+            response = await api_call_with_retry_async(
+                transcribe, model=GEMINI_MODEL, request_type="transcribe", job_id=job_id
+            )
+        return response.text or '', None
+    
+    finally:
+        if myfile is not None:
+            await delete_uploaded_file(audio_client, myfile)
 
-    num_segments = math.ceil(len(audio) / segment_length)
-    print(f"🔪 音檔總長度: {len(audio) / 1000:.2f} 秒，將切分為 {num_segments} 個片段。")
+async def summarize_transcript(audio_client: genai.Client, transcript: str, job_id: Optional[str] = None) -> str:
+    """為單一切片的逐字稿生成摘要"""
+    def summarize():
+        return audio_client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=[SLICE_SUMMARY_PROMPT.format(transcript=transcript)]
+        )
+    
+    summary_response = await api_call_with_retry_async(
+        summarize, model=GEMINI_MODEL, request_type="summarize", job_id=job_id
+    )
+    return summary_response.text or ''
 
-    for i in range(num_segments):
-        start = i * segment_length
-        end = min(start + segment_length + overlap_length, len(audio))
-        segment = audio[start:end]
-        output_path = os.path.join(slice_dir, f"part_{i}.mp3")
-        segment.export(output_path, format="mp3")
-        
-    print(f"🔪 切片完成，已儲存至 {slice_dir}")
-    return state
+def load_slice_plan(slice_dir: str) -> Optional[List[tuple]]:
+    """讀取 plan_windows 寫出的切片範圍"""
+    try:
+        with open(os.path.join(slice_dir, "slice_plan.json"), "r", encoding="utf-8") as f:
+            return [tuple(window) for window in json.load(f)["windows"]]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+def slice_index(slice_name: str) -> Optional[int]:
+    match = re.match(r"part_(\d+)\.", slice_name)
+    return int(match.group(1)) if match else None
 
-def process_single_slice(args: tuple) -> Dict[str, Any]:
-    """Map function: 處理單個音頻切片"""
-    slice_file_path, workspace_path, api_key = args
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：CJK 字元約 1 token，其餘約 4 個字元 1 token"""
+    cjk = len(re.findall(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]", text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def find_overlap_end(prev: str, cur: str, prev_ratio: float, cur_ratio: float) -> int:
+    """
+    對齊前一段逐字稿的結尾與本段的開頭，回傳本段開頭重複內容的長度（字元）
+
+    只比對重疊區對應的文字範圍（依重疊時間佔切片長度的比例估算，並放寬一倍），
+    以最後一個足夠長的相同片段作為對齊點，本段從該處之後接續。
+    """
+    if not prev.strip() or not cur.strip():
+        return 0
+    tail = prev[-(int(len(prev) * prev_ratio * 2) + STITCH_MIN_MATCH_CHARS):]
+    head = cur[:int(len(cur) * cur_ratio * 2) + STITCH_MIN_MATCH_CHARS]
+    matcher = difflib.SequenceMatcher(None, tail, head, autojunk=False)
+    blocks = [block for block in matcher.get_matching_blocks() if block.size >= STITCH_MIN_MATCH_CHARS]
+    if not blocks:
+        return 0
+    return blocks[-1].b + blocks[-1].size
+
+class TranscriptStitcher:
+    """
+    去除相鄰切片在重疊區重複轉錄的內容
+
+    part_i 與 part_{i+1} 的重疊部分會出現在 part_{i+1} 的開頭，因此 part_{i+1}
+    的摘要要等 part_i 的逐字稿出來、去掉重複開頭後才送出。在靜音處下刀的切片
+    沒有重疊，不需要等待。
+    """
     
-    audio_client = genai.Client(api_key=api_key)
+    def __init__(self, workspace_path: str):
+        self.slice_dir = os.path.join(workspace_path, "slice_audio")
+        self.windows = None
+        self.transcripts: Dict[int, asyncio.Future] = {}
     
+    def overlap_ratios(self, index: int) -> Optional[tuple]:
+        """回傳 (重疊佔前一段的比例, 重疊佔本段的比例)；沒有重疊時回傳 None"""
+        if self.windows is None:
+            self.windows = load_slice_plan(self.slice_dir) or []
+        if index is None or index <= 0 or index >= len(self.windows):
+            return None
+        prev_start, prev_end = self.windows[index - 1]
+        cur_start, cur_end = self.windows[index]
+        overlap = prev_end - cur_start
+        if overlap <= 0:
+            return None
+        return overlap / max(1, prev_end - prev_start), overlap / max(1, cur_end - cur_start)
+    
+    def duplicate_length(self, index: int, prev: str, cur: str) -> int:
+        ratios = self.overlap_ratios(index)
+        if ratios is None:
+            return 0
+        return find_overlap_end(prev, cur, *ratios)
+    
+    def _future(self, index: int) -> asyncio.Future:
+        if index not in self.transcripts:
+            self.transcripts[index] = asyncio.get_running_loop().create_future()
+        return self.transcripts[index]
+    
+    def publish(self, index: Optional[int], transcript: str):
+        """公布切片的逐字稿（失敗時為空字串），讓下一段可以對齊"""
+        if index is None:
+            return
+        future = self._future(index)
+        if not future.done():
+            future.set_result(transcript)
+    
+    async def dedup(self, index: Optional[int], transcript: str) -> str:
+        """回傳去掉與前一段重複開頭後的逐字稿，作為摘要的輸入"""
+        self.publish(index, transcript)
+        if self.overlap_ratios(index) is None:
+            return transcript
+        prev = await self._future(index - 1)
+        return transcript[self.duplicate_length(index, prev, transcript):].lstrip()
+    
+    def stitch(self, results: List[Dict[str, Any]]) -> tuple:
+        """依切片順序去除重疊後串成完整逐字稿，回傳 (逐字稿, 移除的重複文字)"""
+        pieces = []
+        removed = []
+        prev = ""
+        for result in sorted(results, key=lambda r: slice_index(r['slice_name']) or 0):
+            cur = result['transcript'] or ""
+            cut = self.duplicate_length(slice_index(result['slice_name']), prev, cur)
+            removed.append(cur[:cut])
+            if cur[cut:].strip():
+                pieces.append(cur[cut:].strip())
+            prev = cur
+        return "\n".join(pieces), "".join(removed)
+
+async def process_single_slice(audio_client: genai.Client, slice_file_path: str,
+                               job_id: Optional[str] = None, audio_hash: Optional[str] = None,
+                               watcher: Optional[FileActivationWatcher] = None,
+                               stitcher: Optional[TranscriptStitcher] = None) -> Dict[str, Any]:
+    """Map function: 處理單個音頻切片（逐字稿與摘要優先使用快取）"""
     slice_name = os.path.basename(slice_file_path)
     print(f"  > 正在處理 {slice_name}...")
     
@@ -282,63 +1914,67 @@ def process_single_slice(args: tuple) -> Dict[str, Any]:
         'slice_name': slice_name,
         'transcript': '',
         'summary': '',
-        'error': None
+        'error': None,
+        'cache_hits': 0,
+        'cache_misses': 0
     }
     
     try:
-        # 上傳檔案
-        print(f"  > 📤 上傳 {slice_name}...")
-        myfile = audio_client.files.upload(file=slice_file_path)
-        
-        # 等待上傳完成
-        max_retries = 60
-        for _ in range(max_retries):
-            myfile = audio_client.files.get(name=myfile.name)
-            if myfile.state == "ACTIVE":
-                break
-            time.sleep(1)
+        raise_if_cancelled(job_id)
         
-        if myfile.state != "ACTIVE":
-            result['error'] = f"檔案上傳失敗，狀態: {myfile.state}"
-            return result
+        if audio_hash is None:
+            audio_hash = await asyncio.to_thread(file_sha256, slice_file_path)
+        transcript_key = result_cache.make_key(audio_hash, GEMINI_MODEL, TRANSCRIBE_PROMPT)
+        combined_key = result_cache.make_key(audio_hash, GEMINI_MODEL, COMBINED_PROMPT)
+        transcript = result_cache.get_text("transcript", transcript_key)
+        summary = None
         
-        # 轉錄
-        print(f"  > 🎤 轉錄 {slice_name}...")
-        def transcribe():
-            prompt = 'Generate a transcript of the speech.'
-            return audio_client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=[prompt, myfile]
+        if transcript is None and COMBINED_MODE:
+            cached = result_cache.get_text("combined", combined_key)
+            if cached is not None:
+                parsed = SliceTranscription.model_validate_json(cached)
+                transcript, summary = parsed.transcript, parsed.summary
+        
+        if transcript is not None:
+            result['cache_hits'] += 1
+            print(f"  > ♻️ 使用快取逐字稿 {slice_name}")
+        else:
+            result['cache_misses'] += 1
+            transcript, summary = await transcribe_slice(
+                audio_client, slice_file_path, job_id, watcher, combined=COMBINED_MODE
             )
+            if summary is not None:
+                parsed = SliceTranscription(transcript=transcript, summary=summary)
+                result_cache.put_text("combined", combined_key, parsed.model_dump_json())
+            else:
+                result_cache.put_text("transcript", transcript_key, transcript)
+        result['transcript'] = transcript
         
-        response = api_call_with_retry(transcribe)
-        result['transcript'] = response.text
+        raise_if_cancelled(job_id)
         
-        # 生成摘要
-        if result['transcript'].strip():
-            print(f"  > 📝 生成摘要 {slice_name}...")
-            def summarize():
-                summary_prompt = f"""
-                請為以下文本生成一個簡潔的摘要，包含：
-                1. 主要內容概述
-                2. 關鍵要點（3-5個）
-                3. 重要決策或結論（如果有的話）
-
-                文本內容：
-                ---
-                {result['transcript']}
-                ---
-
-                摘要：
-                """
-                
-                return audio_client.models.generate_content(
-                    model='gemini-2.5-flash',
-                    contents=[summary_prompt]
-                )
+        # 摘要只看去除重疊後的內容
+        if summary is None and stitcher is not None:
+            with SLICE_STEP_SECONDS.labels("stitch_wait").time():
+                transcript = await stitcher.dedup(slice_index(slice_name), transcript)
+        
+        # 生成摘要（COMBINED_MODE 已取得摘要時略過）
+        if summary is not None:
+            result['summary'] = summary
+        elif transcript.strip():
+            summary_key = result_cache.make_key(transcript, GEMINI_MODEL, SLICE_SUMMARY_PROMPT)
+            summary = result_cache.get_text("summary", summary_key)
             
-            summary_response = api_call_with_retry(summarize)
-            result['summary'] = summary_response.text
+            if summary is not None:
+                result['cache_hits'] += 1
+                print(f"  > ♻️ 使用快取摘要 {slice_name}")
+            else:
+                result['cache_misses'] += 1
+                print(f"  > 📝 生成摘要 {slice_name}...")
+                with SLICE_STEP_SECONDS.labels("summarize").time():
+                    summary = await summarize_transcript(audio_client, transcript, job_id)
+                if summary:
+                    result_cache.put_text("summary", summary_key, summary)
+            result['summary'] = summary
         else:
             result['summary'] = ""
         
@@ -350,55 +1986,149 @@ def process_single_slice(args: tuple) -> Dict[str, Any]:
     
     return result
 
-def map_reduce_process_slices(state: AllState):
-    """MapReduce 主函數：並行處理所有音頻切片"""
+def slice_output_paths(state: AllState, slice_name: str) -> tuple:
+    """回傳切片的 (逐字稿路徑, 摘要路徑)"""
     workspace_path = state['workspace_path']
-    slice_audio_dir = os.path.join(workspace_path, "slice_audio")
-    transcript_dir = os.path.join(workspace_path, "transcript")
-    summary_dir = os.path.join(workspace_path, "summaries")
-    
-    os.makedirs(transcript_dir, exist_ok=True)
-    os.makedirs(summary_dir, exist_ok=True)
-    
-    try:
-        slice_files = [f for f in os.listdir(slice_audio_dir) if f.endswith('.mp3')]
-        slice_files.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
-    except Exception as e:
-        print(f"❌ 讀取切片檔案失敗: {e}")
-        return state
+    base_name = os.path.splitext(slice_name)[0]
+    return (
+        os.path.join(workspace_path, "transcript", f"{base_name}.txt"),
+        os.path.join(workspace_path, "summaries", f"{base_name}_summary.txt"),
+    )
+
+def save_slice_result(state: AllState, manifest: WorkspaceManifest, result: Dict[str, Any], audio_hash: str):
+    """切片一完成就寫出逐字稿、摘要並更新 manifest"""
+    slice_name = result['slice_name']
+    transcript_path, summary_path = slice_output_paths(state, slice_name)
     
-    if not slice_files:
-        print("⚠️ 未找到任何音頻切片")
-        return state
+    if result['transcript']:
+        write_text_atomic(transcript_path, result['transcript'])
+    if result['summary']:
+        write_text_atomic(summary_path, result['summary'])
     
-    print(f"🔄 開始 MapReduce 處理 {len(slice_files)} 個切片...")
+    done = not result['error'] and (bool(result['summary']) or not result['transcript'].strip())
+    manifest.record(slice_name, {
+        "status": "done" if done else "failed",
+        "audio_hash": audio_hash,
+        "has_transcript": bool(result['transcript']),
+        "has_summary": bool(result['summary']),
+        "error": result['error'],
+    })
+
+def load_slice_result(state: AllState, manifest: WorkspaceManifest, slice_name: str,
+                      audio_hash: str) -> Optional[Dict[str, Any]]:
+    """從 workspace 讀回已完成的切片結果；沒有有效紀錄時回傳 None"""
+    entry = manifest.completed(slice_name, audio_hash)
+    if entry is None:
+        return None
     
-    slice_paths = [os.path.join(slice_audio_dir, f) for f in slice_files]
-    map_args = [(path, workspace_path, api_key) for path in slice_paths]
+    transcript_path, summary_path = slice_output_paths(state, slice_name)
+    result = {
+        'slice_name': slice_name,
+        'transcript': '',
+        'summary': '',
+        'error': None,
+        'resumed': True
+    }
+    try:
+        if entry.get("has_transcript"):
+            with open(transcript_path, 'r', encoding='utf-8') as f:
+                result['transcript'] = f.read()
+        if entry.get("has_summary"):
+            with open(summary_path, 'r', encoding='utf-8') as f:
+                result['summary'] = f.read()
+    except FileNotFoundError:
+        return None
+    return result
+
+async def process_slice_checkpointed(audio_client: genai.Client, state: AllState, manifest: WorkspaceManifest,
+                                     slice_file_path: str, watcher: FileActivationWatcher,
+                                     stitcher: TranscriptStitcher) -> Dict[str, Any]:
+    """已在 manifest 中完成的切片直接讀回，其餘處理後立即存檔"""
+    slice_name = os.path.basename(slice_file_path)
+    result = None
+    started_at = time.time()
+    try:
+        with SLICE_STEP_SECONDS.labels("hash").time():
+            audio_hash = await asyncio.to_thread(file_sha256, slice_file_path)
+        
+        result = load_slice_result(state, manifest, slice_name, audio_hash)
+        if result is not None:
+            print(f"  > ⏭️ {slice_name} 已於先前完成，略過")
+            return result
+        
+        result = await process_single_slice(
+            audio_client, slice_file_path, state.get('job_id'), audio_hash, watcher, stitcher
+        )
+        save_slice_result(state, manifest, result, audio_hash)
+        return result
+    finally:
+        # 結果已寫入 manifest，切片音檔不再需要；斷點續跑時會重新切出相同的切片
+        if not WORKSPACE_KEEP_SLICES and result is not None and not result['error']:
+            try:
+                os.remove(slice_file_path)
+            except FileNotFoundError:
+                pass
+        # 不論成功與否都要公布，下一段才不會一直等待
+        stitcher.publish(slice_index(slice_name), result['transcript'] if result else "")
+        SLICE_STEP_SECONDS.labels("total").observe(time.time() - started_at)
+        if result is not None:
+            emit_event(
+                state.get('job_id'), "slice_done",
+                slice_name=slice_name,
+                index=slice_index(slice_name),
+                transcript=result['transcript'],
+                summary=result['summary'],
+                error=result['error'],
+                resumed=bool(result.get('resumed')),
+            )
+
+async def map_slices(state: AllState, slice_paths: List[str]) -> List[Dict[str, Any]]:
+    """在單一事件迴圈中並行處理所有切片，並行數受 MAP_CONCURRENCY 與速率額度限制"""
+    audio_client = create_genai_client()
+    manifest = WorkspaceManifest(state['workspace_path'])
+    watcher = FileActivationWatcher(audio_client)
+    stitcher = TranscriptStitcher(state['workspace_path'])
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
     
-    num_processes = min(2, cpu_count(), len(slice_files))
-    print(f"🚀 使用 {num_processes} 個進程並行處理...")
+    async def bounded(path):
+        async with semaphore:
+            return await process_slice_checkpointed(audio_client, state, manifest, path, watcher, stitcher)
     
-    with Pool(processes=num_processes) as pool:
-        results = pool.map(process_single_slice, map_args)
+    results = await asyncio.gather(*(bounded(path) for path in slice_paths))
+    watcher.report()
+    return results
+
+def stitch_transcripts(state: AllState, results: List[Dict[str, Any]]):
+    """去除重疊區的重複內容，寫出整份逐字稿 workspace/<file>/transcript.txt"""
+    transcript, duplicate = TranscriptStitcher(state['workspace_path']).stitch(results)
+    write_text_atomic(os.path.join(state['workspace_path'], "transcript.txt"), transcript)
     
+    duplicate_tokens = estimate_tokens(duplicate)
+    state['dedup_stats'] = {
+        "duplicate_chars": len(duplicate),
+        "duplicate_tokens": duplicate_tokens,
+        # COMBINED_MODE 的摘要直接由音訊產生，重疊內容無法在摘要前去除
+        "summary_input_tokens_saved": 0 if COMBINED_MODE else duplicate_tokens,
+    }
+    if duplicate:
+        print(f"🧵 逐字稿拼接：移除重疊區重複內容 {len(duplicate)} 字元（約 {duplicate_tokens} tokens）")
+
+def collect_slice_results(state: AllState, results: List[Dict[str, Any]]):
+    """統計各切片結果，並把摘要依切片順序放入 state"""
     all_summaries = []
     success_count = 0
     error_count = 0
+    resumed_count = 0
+    cache_stats = state.get('cache_stats') or {"hits": 0, "misses": 0}
     
     for result in results:
         slice_name = result['slice_name']
-        base_name = slice_name.replace('.mp3', '')
-        
-        if result['transcript']:
-            transcript_path = os.path.join(transcript_dir, f"{base_name}.txt")
-            with open(transcript_path, 'w', encoding='utf-8') as f:
-                f.write(result['transcript'])
+        cache_stats["hits"] += result.get('cache_hits', 0)
+        cache_stats["misses"] += result.get('cache_misses', 0)
+        if result.get('resumed'):
+            resumed_count += 1
         
         if result['summary']:
-            summary_path = os.path.join(summary_dir, f"{base_name}_summary.txt")
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                f.write(result['summary'])
             all_summaries.append(result['summary'])
             success_count += 1
         
@@ -407,60 +2137,238 @@ def map_reduce_process_slices(state: AllState):
             error_count += 1
     
     state['slice_summaries'] = all_summaries
+    state['cache_stats'] = cache_stats
+    stitch_transcripts(state, results)
     
-    print(f"🎉 MapReduce 處理完成：成功 {success_count} 個，失敗 {error_count} 個")
+    emit_event(
+        state.get('job_id'), "map_done",
+        succeeded=success_count, failed=error_count, resumed=resumed_count,
+        dedup=state.get('dedup_stats') or {},
+    )
+    print(f"🎉 MapReduce 處理完成：成功 {success_count} 個（其中 {resumed_count} 個沿用先前結果），失敗 {error_count} 個")
+    print(f"♻️ 快取命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
     return state
 
-def reduce_final_summary(state: AllState):
-    """Reduce 函數：將所有切片摘要合併成最終摘要"""
-    if 'slice_summaries' not in state or not state['slice_summaries']:
-        print("⚠️ 沒有找到切片摘要，跳過最終摘要生成")
-        state['final_summary'] = "無法生成摘要：沒有找到任何切片摘要"
+def map_reduce_process_slices(state: AllState):
+    """MapReduce 主函數：並行處理所有音頻切片"""
+    slice_paths = state.get('slice_paths') or []
+    
+    if not slice_paths:
+        print("⚠️ 未找到任何音頻切片")
         return state
     
-    workspace_path = state['workspace_path']
-    summary_dir = os.path.join(workspace_path, "summaries")
+    print(f"🔄 開始 MapReduce 處理 {len(slice_paths)} 個切片（最多同時 {MAP_CONCURRENCY} 個）...")
+    results = run_async(map_slices(state, slice_paths))
+    raise_if_cancelled(state.get('job_id'))
     
-    print("🔄 開始生成最終摘要...")
+    return collect_slice_results(state, results)
+
+async def slice_and_map_slices(state: AllState) -> tuple:
+    """切片執行緒把切片放進有界佇列，事件迴圈一收到就開始上傳/轉錄"""
+    loop = asyncio.get_running_loop()
+    slice_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    done = object()
     
-    combined_summaries = "\n\n".join(state['slice_summaries'])
+    def produce():
+        def put(item):
+            # 佇列已滿時阻塞切片執行緒，形成背壓
+            asyncio.run_coroutine_threadsafe(slice_queue.put(item), loop).result()
+        try:
+            for path in iter_slices(state):
+                raise_if_cancelled(state.get('job_id'))
+                put(path)
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
     
-    final_summary_prompt = f"""
-    請基於以下各個片段的摘要，生成一個完整的、結構化的最終摘要。
+    audio_client = create_genai_client()
+    manifest = WorkspaceManifest(state['workspace_path'])
+    watcher = FileActivationWatcher(audio_client)
+    stitcher = TranscriptStitcher(state['workspace_path'])
+    # 執行中的切片數量上限，讓切片佇列能真正產生背壓
+    in_flight = asyncio.Semaphore(MAP_CONCURRENCY)
+    started_at = time.time()
+    first_result_at = []
     
-    要求：
-    1. 提供整體內容的主旨概述
-    2. 整理並合併所有關鍵要點（去除重複）
-    3. 識別重要的決策、結論或行動項目
-    4. 保持邏輯順序和連貫性
-    5. 使用清晰的標題和結構
+    async def run_slice(path):
+        try:
+            result = await process_slice_checkpointed(audio_client, state, manifest, path, watcher, stitcher)
+        finally:
+            in_flight.release()
+        if not first_result_at:
+            first_result_at.append(time.time())
+            print(f"⚡ 第一個切片摘要完成，耗時 {first_result_at[0] - started_at:.1f} 秒")
+        return result
     
-    各片段摘要：
-    ---
-    {combined_summaries}
-    ---
+    producer = loop.run_in_executor(None, produce)
     
-    最終摘要：
+    slice_paths = []
+    tasks = []
+    slice_error = None
+    
+    while True:
+        item = await slice_queue.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            slice_error = item
+            continue
+        
+        await in_flight.acquire()
+        slice_paths.append(item)
+        tasks.append(asyncio.create_task(run_slice(item)))
+    
+    results = await asyncio.gather(*tasks)
+    await producer
+    watcher.report()
+    return slice_paths, results, slice_error
+
+def slice_and_map_process(state: AllState):
+    """Streaming 模式：切片與轉錄同時進行，每個切片產生後立即開始處理"""
+    started_at = time.time()
+    print(f"🚀 Streaming 模式：切片與轉錄同時進行（最多同時 {MAP_CONCURRENCY} 個切片）...")
+    
+    slice_paths, results, slice_error = run_async(slice_and_map_slices(state))
+    state['slice_paths'] = slice_paths
+    raise_if_cancelled(state.get('job_id'))
+    
+    if slice_error is not None:
+        print(f"❌ 載入音檔失敗: {state['raw_audio_path']}: {slice_error}")
+        raise slice_error
+    
+    if not slice_paths:
+        print("⚠️ 未找到任何音頻切片")
+        return state
+    
+    print(f"🔪 切片完成，共 {len(slice_paths)} 個，總耗時 {time.time() - started_at:.1f} 秒")
+    return collect_slice_results(state, results)
+
+async def generate_summary_cached(audio_client: genai.Client, kind: str, prompt_template: str,
+                                  summaries: List[str], cache_stats: Dict[str, int],
+                                  on_delta: Optional[Callable[[str], None]] = None,
+                                  job_id: Optional[str] = None,
+                                  on_reset: Optional[Callable[[], None]] = None) -> str:
     """
+    以 prompt_template 合併多份摘要，結果存入快取
+
+    有 on_delta 時改用串流呼叫，每收到一段文字就回呼一次；快取命中時整份摘要回呼一次。
+    串流中途失敗而重試時會從頭重新串流，重試前呼叫 on_reset，讓接收端捨棄已收到的文字。
+    """
+    combined_summaries = "\n\n".join(summaries)
+    key = result_cache.make_key(combined_summaries, GEMINI_MODEL, prompt_template)
+    summary = result_cache.get_text(kind, key)
+    if summary is not None:
+        cache_stats["hits"] += 1
+        if on_delta is not None:
+            on_delta(summary)
+        return summary
     
-    try:
-        audio_client = genai.Client(api_key=api_key)
+    cache_stats["misses"] += 1
+    contents = [prompt_template.format(summaries=combined_summaries)]
+    
+    async def generate():
+        response = await audio_client.aio.models.generate_content(model=GEMINI_MODEL, contents=contents)
+        return response.text or ''
+    
+    streamed = False
+    
+    async def generate_stream():
+        nonlocal streamed
+        if streamed and on_reset is not None:
+            on_reset()
+        streamed = False
+        chunks = []
+        usage = None
+        stream = await audio_client.aio.models.generate_content_stream(model=GEMINI_MODEL, contents=contents)
+        async for chunk in stream:
+            # 串流回應的 token 用量以最後一段為準
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                chunks.append(chunk.text)
+                on_delta(chunk.text)
+                streamed = True
+        record_token_usage("summarize", usage)
+        return "".join(chunks)
+    
+    summary = await api_call_with_retry_async(
+        generate if on_delta is None else generate_stream, model=GEMINI_MODEL, request_type="summarize",
+        job_id=job_id
+    )
+    if summary:
+        result_cache.put_text(kind, key, summary)
+    return summary
+
+async def tree_reduce_summaries(state: AllState, summaries: List[str], cache_stats: Dict[str, int]) -> str:
+    """分層合併摘要：每層的各組並行處理，讓最終一次呼叫的輸入長度維持固定上限"""
+    audio_client = create_genai_client()
+    summary_dir = os.path.join(state['workspace_path'], "summaries")
+    group_size = max(2, REDUCE_GROUP_SIZE)
+    fan_in = max(2, REDUCE_FAN_IN)
+    
+    level = 0
+    while len(summaries) > (group_size if level == 0 else fan_in):
+        raise_if_cancelled(state.get('job_id'))
+        size = group_size if level == 0 else fan_in
+        groups = [summaries[i:i + size] for i in range(0, len(summaries), size)]
+        level += 1
+        print(f"🌲 Reduce 第 {level} 層：{len(summaries)} 份摘要分成 {len(groups)} 組並行合併...")
+        emit_event(state.get('job_id'), "reduce", level=level, inputs=len(summaries), groups=len(groups))
         
-        def generate_final_summary():
-            return audio_client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=[final_summary_prompt]
+        async def merge(group):
+            if len(group) == 1:
+                return group[0]
+            return await generate_summary_cached(
+                audio_client, "group_summary", GROUP_SUMMARY_PROMPT, group, cache_stats, job_id=state.get('job_id')
             )
         
-        response = api_call_with_retry(generate_final_summary)
+        merged = await asyncio.gather(*(merge(group) for group in groups))
+        summaries = [summary for summary in merged if summary]
+        if not summaries:
+            raise Exception(f"第 {level} 層合併沒有產生任何摘要")
+        
+        for i, summary in enumerate(summaries):
+            write_text_atomic(os.path.join(summary_dir, f"level_{level}_group_{i}_summary.txt"), summary)
+    
+    raise_if_cancelled(state.get('job_id'))
+    job_id = state.get('job_id')
+    on_delta = on_reset = None
+    if job_id:
+        # 最終摘要以串流方式產生，逐段送給 SSE 用戶端；重試前送出 summary_reset，用戶端清除已收到的文字
+        on_delta = lambda text: emit_event(job_id, "summary_delta", text=text)
+        on_reset = lambda: emit_event(job_id, "summary_reset")
+    return await generate_summary_cached(
+        audio_client, "final_summary", FINAL_SUMMARY_PROMPT, summaries, cache_stats, on_delta, job_id, on_reset
+    )
+
+def reduce_final_summary(state: AllState):
+    """Reduce 函數：將所有切片摘要（必要時分層）合併成最終摘要"""
+    if 'slice_summaries' not in state or not state['slice_summaries']:
+        print("⚠️ 沒有找到切片摘要，跳過最終摘要生成")
+        state['final_summary'] = "無法生成摘要：沒有找到任何切片摘要"
+        return state
+    
+    raise_if_cancelled(state.get('job_id'))
+    workspace_path = state['workspace_path']
+    summary_dir = os.path.join(workspace_path, "summaries")
+    
+    print(f"🔄 開始生成最終摘要（{len(state['slice_summaries'])} 份切片摘要）...")
+    
+    cache_stats = state.get('cache_stats') or {"hits": 0, "misses": 0}
+    state['cache_stats'] = cache_stats
+    
+    try:
+        final_summary = run_async(tree_reduce_summaries(state, state['slice_summaries'], cache_stats))
         
         final_summary_path = os.path.join(summary_dir, "final_summary.txt")
         with open(final_summary_path, 'w', encoding='utf-8') as f:
-            f.write(response.text)
+            f.write(final_summary)
         
-        state['final_summary'] = response.text
+        state['final_summary'] = final_summary
         print("✅ 最終摘要生成完成")
-        
+    
+    except (JobCancelled, JobDeadlineExceeded):
+        raise
     except Exception as e:
         error_msg = f"生成最終摘要時發生錯誤: {str(e)}"
         print(f"❌ {error_msg}")
@@ -468,34 +2376,88 @@ def reduce_final_summary(state: AllState):
     
     return state
 
-# Build the state graph
-graph_builder = StateGraph(AllState)
-graph_builder.add_node("create_dir", create_dir)
-graph_builder.add_node("slice_audio", slice_audio)
-graph_builder.add_node("map_reduce_process", map_reduce_process_slices)
-graph_builder.add_node("reduce_final_summary", reduce_final_summary)
+def build_langgraph_app():
+    """建立並編譯 LangGraph 流程圖（langgraph 在這裡才載入，約需一秒）"""
+    global add_messages
+    from langgraph.graph import StateGraph
+    from langgraph.graph.message import add_messages
+    
+    graph_builder = StateGraph(AllState)
+    graph_builder.add_node("create_dir", timed_node("create_dir", create_dir))
+    graph_builder.add_node("reduce_final_summary", timed_node("reduce_final_summary", reduce_final_summary))
+    graph_builder.set_entry_point("create_dir")
+    
+    if PIPELINE_MODE == "streaming":
+        graph_builder.add_node("slice_and_map", timed_node("slice_and_map", slice_and_map_process))
+        graph_builder.add_edge("create_dir", "slice_and_map")
+        graph_builder.add_edge("slice_and_map", "reduce_final_summary")
+    else:
+        graph_builder.add_node("slice_audio", timed_node("slice_audio", slice_audio))
+        graph_builder.add_node("map_reduce_process", timed_node("map_reduce_process", map_reduce_process_slices))
+        graph_builder.add_edge("create_dir", "slice_audio")
+        graph_builder.add_edge("slice_audio", "map_reduce_process")
+        graph_builder.add_edge("map_reduce_process", "reduce_final_summary")
+    
+    graph_builder.set_finish_point("reduce_final_summary")
+    return graph_builder.compile()
+
+langgraph_app = None
+langgraph_lock = threading.Lock()
+
+def get_langgraph_app():
+    """第一次使用時編譯流程圖，之後共用同一份"""
+    global langgraph_app
+    with langgraph_lock:
+        if langgraph_app is None:
+            langgraph_app = build_langgraph_app()
+        return langgraph_app
 
-graph_builder.set_entry_point("create_dir")
-graph_builder.add_edge("create_dir", "slice_audio")
-graph_builder.add_edge("slice_audio", "map_reduce_process")
-graph_builder.add_edge("map_reduce_process", "reduce_final_summary")
-graph_builder.set_finish_point("reduce_final_summary")
+# 預熱狀態：pending / running / ready / failed，由 /health 回報
+warmup_status = "pending"
 
-langgraph_app = graph_builder.compile()
+def warm_up():
+    """載入處理請求時需要的大型套件並編譯流程圖，讓第一個請求不必等待"""
+    global warmup_status
+    warmup_status = "running"
+    start = time.perf_counter()
+    try:
+        for module in (genai, types, genai_errors, httpx, aiohttp, certifi, pytubefix, pytubefix_cli, extract):
+            if module is not None:
+                # 存取任一屬性即觸發實際的 import
+                getattr(module, "__name__")
+        get_langgraph_app()
+    except Exception as e:
+        warmup_status = "failed"
+        print(f"❌ 預熱失敗，改為第一次處理請求時載入: {e}")
+        return
+    warmup_status = "ready"
+    print(f"🔥 預熱完成 ({time.perf_counter() - start:.2f} 秒)")
 
-def process_audio_file(file_path: str, file_name: str) -> dict:
+if WARMUP_MODE == "eager":
+    warm_up()
+
+def process_audio_file(file_path: str, file_name: str, job_id: Optional[str] = None) -> dict:
     """處理音頻檔案的核心邏輯"""
     init_state: AllState = {
         "messages": [], 
+        "job_id": job_id,
         "file_name": file_name,
         "raw_audio_path": file_path,
         "workspace_path": "",
+        "slice_paths": [],
         "slice_summaries": [],
-        "final_summary": ""
+        "final_summary": "",
+        "cache_stats": {"hits": 0, "misses": 0},
+        "dedup_stats": {}
     }
     
     print(f"🚀 開始執行 LangGraph 流程 for {file_name}...")
-    response = langgraph_app.invoke(init_state)
+    workspace_key = workspace_manager.key_for(file_path, file_name)
+    workspace_manager.acquire(workspace_key, job_id)
+    try:
+        response = get_langgraph_app().invoke(init_state)
+    finally:
+        workspace_manager.release(workspace_key)
     print("🏁 流程執行完畢。")
     
     final_summary = response.get('final_summary', '')
@@ -510,26 +2472,549 @@ def process_audio_file(file_path: str, file_name: str) -> dict:
         "file_name": file_name,
         "workspace_path": response['workspace_path'],
         "final_summary": final_summary,
-        "slice_count": slice_count
+        "slice_count": slice_count,
+        "cache": response.get('cache_stats') or {"hits": 0, "misses": 0},
+        "dedup": response.get('dedup_stats') or {}
     }
 
-@fastapi_app.post("/process_audio/")
-async def process_audio(audio_file: UploadFile = File(...)):
-    """處理上傳的音頻檔案"""
+def youtube_dedup_key(youtube_url: str) -> Optional[str]:
+    """同一支影片的工作共用 audio/ 與 workspace/ 目錄，以影片 id 去重"""
+    try:
+        return f"youtube:{extract.video_id(youtube_url)}"
+    except Exception:
+        # 網址無法解析時交給工作本身回報錯誤
+        return None
+
+def process_youtube_url(youtube_url: str, job_id: Optional[str] = None) -> dict:
+    """下載 YouTube 音訊後走相同的處理流程"""
+    file_path, file_name = download_youtube_audio(youtube_url)
+    raise_if_cancelled(job_id)
+    
+    result = process_audio_file(file_path, file_name, job_id)
+    result["source"] = "youtube"
+    result["youtube_url"] = youtube_url
+    return result
+
+# =====================================
+# 背景工作
+# =====================================
+
+class JobCancelled(Exception):
+    """工作已被使用者取消"""
+
+class JobQueueFull(Exception):
+    """排隊中的工作已達上限"""
+
+class Job:
+    """一次 pipeline 執行的狀態"""
+    
+    def __init__(self, kind: str, source: str):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.source = source
+        self.status = "queued"  # queued / running / succeeded / failed / cancelled
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # 超過此時間點後不再等待重試（開始執行時依 JOB_DEADLINE_SECONDS 設定）
+        self.deadline = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        # 內容相同的工作共用同一個 job（例如上傳檔案的 SHA-256）
+        self.dedup_key = None
+        # SSE 事件紀錄：事件 id 即為在列表中的位置，重新連線時可從 Last-Event-ID 接續
+        self.events: List[Dict[str, Any]] = []
+        self.events_lock = threading.Lock()
+        # 最後一個事件（結束狀態與結果）送出後才設為 True
+        self.events_closed = False
+    
+    def emit(self, event: str, data: Dict[str, Any], last: bool = False):
+        with self.events_lock:
+            self.events.append({"id": len(self.events), "event": event, "data": data})
+            self.events_closed = self.events_closed or last
+    
+    def events_since(self, last_event_id: int) -> List[Dict[str, Any]]:
+        with self.events_lock:
+            return self.events[last_event_id + 1:]
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "source": self.source,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "deadline": self.deadline,
+            "error": self.error,
+        }
+
+class JobManager:
+    """以固定大小的執行緒池執行 pipeline，限制同時執行與排隊中的工作數量"""
+    
+    def __init__(self, max_concurrent_jobs: int, max_queued_jobs: int):
+        self.max_queued_jobs = max_queued_jobs
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="job")
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        print(f"🧵 工作佇列初始化：同時執行 {max_concurrent_jobs} 個，最多排隊 {max_queued_jobs} 個")
+    
+    def submit(self, kind: str, source: str, func, *args, dedup_key: Optional[str] = None) -> Job:
+        """
+        建立工作並放入佇列；func 會以 job_id 作為最後一個參數被呼叫
+
+        有 dedup_key 且相同 key 的工作仍在排隊或執行中時，直接回傳該工作，不重複消耗額度。
+        """
+        job = Job(kind, source)
+        job.dedup_key = dedup_key
+        with self.lock:
+            if dedup_key is not None:
+                for existing in self.jobs.values():
+                    if existing.dedup_key == dedup_key and not existing.finished and not existing.cancel_event.is_set():
+                        print(f"♻️ 相同內容的工作 {existing.job_id} 尚在進行，沿用該工作")
+                        return existing
+            self.check_capacity()
+            self.jobs[job.job_id] = job
+            self._prune_history()
+        
+        job.future = self.executor.submit(self._run, job, func, args)
+        print(f"📋 已建立工作 {job.job_id} ({kind}: {source})")
+        return job
+    
+    def check_capacity(self):
+        """排隊中的工作已達上限時拋出 JobQueueFull；上傳前先檢查，不必收完整個檔案才拒絕"""
+        queued = sum(1 for j in self.jobs.values() if j.status == "queued")
+        if queued >= self.max_queued_jobs:
+            raise JobQueueFull(f"排隊中的工作已達上限 ({self.max_queued_jobs})，請稍後再試")
+    
+    def _run(self, job: Job, func, args):
+        if job.cancel_event.is_set():
+            # future 已開始執行時 cancel() 無法取消它，由這裡把工作標記為已取消並結束事件串流
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.emit("status", job.to_dict(), last=True)
+            return None
+        
+        job.status = "running"
+        job.started_at = time.time()
+        if JOB_DEADLINE_SECONDS > 0:
+            job.deadline = job.started_at + JOB_DEADLINE_SECONDS
+        job.emit("status", job.to_dict())
+        JOBS_RUNNING.inc()
+        try:
+            job.result = func(*args, job.job_id)
+            job.status = "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+            print(f"🛑 工作 {job.job_id} 已取消")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ 工作 {job.job_id} 失敗: {e}")
+        finally:
+            job.finished_at = time.time()
+            JOBS_RUNNING.dec()
+            JOB_SECONDS.labels(job.kind, job.status).observe(job.finished_at - job.started_at)
+            if job.status == "succeeded":
+                job.emit("status", job.to_dict())
+                job.emit("result", job.result, last=True)
+            else:
+                job.emit("status", job.to_dict(), last=True)
+        return job.result
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+    
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """排隊中的工作直接取消；執行中的工作在下一個檢查點停止"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.emit("status", job.to_dict(), last=True)
+        return job
+    
+    def _prune_history(self):
+        finished = [j for j in self.jobs.values() if j.finished]
+        if len(finished) <= JOB_HISTORY_LIMIT:
+            return
+        finished.sort(key=lambda j: j.finished_at or 0)
+        for job in finished[:len(finished) - JOB_HISTORY_LIMIT]:
+            del self.jobs[job.job_id]
+
+job_manager = JobManager(MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS)
+
+def raise_if_cancelled(job_id: Optional[str]):
+    """pipeline 檢查點：工作被取消或超過期限時中止執行"""
+    if not job_id:
+        return
+    job = job_manager.get(job_id)
+    if job is None:
+        return
+    if job.cancel_event.is_set():
+        raise JobCancelled(f"工作 {job_id} 已取消")
+    if job.deadline is not None and time.time() >= job.deadline:
+        raise JobDeadlineExceeded(f"工作 {job_id} 無法在 {JOB_DEADLINE_SECONDS:.0f} 秒的執行期限內完成")
+
+def job_time_remaining(job_id: Optional[str]) -> Optional[float]:
+    """工作距離期限還有幾秒；不是背景工作或沒有期限時回傳 None"""
+    job = job_manager.get(job_id) if job_id else None
+    if job is None or job.deadline is None:
+        return None
+    return max(0.0, job.deadline - time.time())
+
+def expire_job_deadline(job_id: Optional[str]):
+    """重試已來不及在期限內完成：讓期限立即到期，其他切片在下一個檢查點就停止"""
+    job = job_manager.get(job_id) if job_id else None
+    if job is not None and job.deadline is not None:
+        job.deadline = min(job.deadline, time.time())
+
+def emit_event(job_id: Optional[str], event: str, **data):
+    """送出 pipeline 進度事件給訂閱該工作的 SSE 用戶端；不是背景工作時不做任何事"""
+    if not job_id:
+        return
+    job = job_manager.get(job_id)
+    if job is not None:
+        job.emit(event, data)
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+async def job_event_stream(job: Job, last_event_id: int = -1, announce: bool = False):
+    """依序送出工作事件直到工作結束；用戶端斷線不影響工作本身"""
+    if announce:
+        yield format_sse("job", job.to_dict())
+    
+    last_sent_at = time.time()
+    while True:
+        # 先確認是否已結束再取事件，結束前送出的最後一批事件才不會漏掉
+        finished = job.events_closed
+        events = job.events_since(last_event_id)
+        for event in events:
+            yield format_sse(event["event"], event["data"], event["id"])
+            last_event_id = event["id"]
+        if events:
+            last_sent_at = time.time()
+        elif finished:
+            return
+        elif time.time() - last_sent_at >= SSE_KEEPALIVE_INTERVAL:
+            yield ": keep-alive\n\n"
+            last_sent_at = time.time()
+        
+        if not events:
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+
+def sse_response(job: Job, last_event_id: int = -1, announce: bool = False) -> StreamingResponse:
+    return StreamingResponse(
+        job_event_stream(job, last_event_id, announce),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def queue_full_response(e: JobQueueFull) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "error",
+            "message": str(e),
+            "final_summary": ""
+        }
+    )
+
+class UploadRejected(Exception):
+    """上傳內容不符合要求（格式錯誤或超過大小上限）"""
+    
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def upload_rejected_response(e: UploadRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=e.status_code,
+        content={
+            "status": "error",
+            "message": str(e),
+            "final_summary": ""
+        }
+    )
+
+# 上傳時仍在進行的靜音分析：音檔路徑 -> 分析結束（成功或失敗）時 set 的 Event
+pending_silence_analyses: Dict[str, threading.Event] = {}
+
+class StreamingSilenceDetector:
+    """
+    上傳時在背景跟著已寫入的部分做靜音分析（類似 tail -f），結果存成音檔旁的 sidecar
+
+    分析直接讀取正在寫入的暫存檔，進度落後時也不會拖慢上傳；上傳結束後若尚未分析完，
+    會在背景繼續，get_silences 會等它完成而不是重新分析。只用於可串流解碼的格式，
+    分析失敗時切片階段會再對完整檔案分析一次。
+    """
+    
+    READ_SIZE = 1024 * 1024
+    
+    def __init__(self, tmp_path: str):
+        self.tmp_path = tmp_path
+        # 上傳完成、知道內容雜湊後才確定最終路徑，之前先以暫存檔路徑登記
+        self.file_path = tmp_path
+        self.written = 0
+        self.closed = False
+        self.data_ready = asyncio.Event()
+        self.done = threading.Event()
+        self.task = None
+        self.file = None
+    
+    def start(self):
+        # 在上傳端 rename 暫存檔之前就開啟，之後改名也能透過同一個 file handle 繼續讀取
+        self.file = open(self.tmp_path, "rb")
+        pending_silence_analyses[self.file_path] = self.done
+        self.task = asyncio.create_task(self._run())
+    
+    def notify(self, written: int):
+        """上傳端每寫入一塊就更新已寫入的位元組數"""
+        self.written = written
+        self.data_ready.set()
+    
+    def close(self, file_path: str):
+        """上傳完成並已移到 file_path，讀到目前大小即可結束輸入"""
+        pending_silence_analyses.pop(self.file_path, None)
+        self.file_path = file_path
+        pending_silence_analyses[file_path] = self.done
+        self.closed = True
+        self.data_ready.set()
+    
+    async def abort(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        # 工作在開始執行前就被取消時不會進入 _run 的 finally
+        if self.file is not None:
+            self.file.close()
+    
+    async def _run(self):
+        proc = None
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *silence_detect_command("pipe:0"),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            # 持續讀取 stderr，避免管線塞滿讓 ffmpeg 停住
+            stderr_task = asyncio.create_task(proc.stderr.read())
+            
+            offset = 0
+            while True:
+                if offset < self.written:
+                    data = await asyncio.to_thread(self.file.read, min(self.READ_SIZE, self.written - offset))
+                    offset += len(data)
+                    proc.stdin.write(data)
+                    await proc.stdin.drain()
+                elif self.closed:
+                    break
+                else:
+                    self.data_ready.clear()
+                    await self.data_ready.wait()
+            
+            proc.stdin.close()
+            returncode = await proc.wait()
+            output = (await stderr_task).decode("utf-8", errors="replace")
+            # 工作被拒絕時音檔已被刪除，不必留下分析結果
+            if returncode == 0 and os.path.exists(self.file_path):
+                save_silences(self.file_path, parse_silencedetect(output))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ 上傳時的靜音分析失敗，切片時將重新分析: {e}")
+        finally:
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+            self.file.close()
+            pending_silence_analyses.pop(self.file_path, None)
+            self.done.set()
+
+async def ingest_upload(request: Request, field_name: str = "audio_file") -> tuple[str, str, str]:
+    """
+    直接從 request body 串流解析 multipart，把檔案分塊寫入 audio/<sha256 前 16 碼>/，回傳 (file_path, file_name, sha256)
+
+    不經過 UploadFile 的暫存檔，每個位元組只寫入磁碟一次，寫入時不阻塞事件迴圈；
+    同時計算 SHA-256、檢查大小上限，可串流解碼的格式也在接收時開始靜音分析。
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected(f"請以 multipart/form-data 上傳，檔案欄位名稱為 {field_name}")
+    
+    limit_mb = MAX_UPLOAD_BYTES / 1024 / 1024
+    content_length = request.headers.get("content-length", "")
+    # Content-Length 含 multipart 標頭，預留一些空間
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
+        raise UploadRejected(f"檔案超過大小上限 ({limit_mb:.0f} MB)", 413)
+    
+    # parser 的回呼是同步的，先收集事件，再在事件迴圈中非同步寫檔
+    events = []
+    header_field = bytearray()
+    header_value = bytearray()
+    headers = {}
+    
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+    
+    def on_headers_finished():
+        events.append(("headers", dict(headers)))
+        headers.clear()
+    
+    parser = MultipartParser(boundary, callbacks={
+        "on_header_field": lambda data, start, end: header_field.extend(data[start:end]),
+        "on_header_value": lambda data, start, end: header_value.extend(data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    })
+    
+    audio_root = os.path.join(pwd, "audio")
+    os.makedirs(audio_root, exist_ok=True)
+    
+    file_name = None
+    tmp_path = None
+    out = None
+    detector = None
+    receiving = False
+    received = False
+    size = 0
+    hasher = hashlib.sha256()
+    started_at = time.time()
+    
     try:
-        os.makedirs(os.path.join(pwd, "audio"), exist_ok=True)
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == "headers":
+                    _, options = parse_options_header(payload.get(b"content-disposition", b""))
+                    filename = options.get(b"filename")
+                    receiving = (
+                        not received and filename is not None
+                        and options.get(b"name") == field_name.encode()
+                    )
+                    if receiving:
+                        file_name = sanitize_filename(os.path.basename(filename.decode("utf-8", errors="replace")))
+                        file_name = file_name or "upload"
+                        print(f"📥 接收檔案: {file_name}")
+                        tmp_path = os.path.join(audio_root, f".{file_name}.{uuid.uuid4().hex}.part")
+                        out = await aiofiles.open(tmp_path, "wb")
+                        ext = os.path.splitext(file_name)[1].lower()
+                        if SLICE_STRATEGY == "adaptive" and ext in STREAMABLE_UPLOAD_EXTENSIONS:
+                            detector = StreamingSilenceDetector(tmp_path)
+                            detector.start()
+                elif kind == "data" and receiving:
+                    size += len(payload)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise UploadRejected(f"檔案超過大小上限 ({limit_mb:.0f} MB)", 413)
+                    hasher.update(payload)
+                    await out.write(payload)
+                    if detector is not None:
+                        # aiofiles 有自己的緩衝，先 flush 讓分析端讀得到
+                        await out.flush()
+                        detector.notify(size)
+                elif kind == "end" and receiving:
+                    receiving = False
+                    received = True
+                    await out.close()
+                    out = None
+            events.clear()
+        parser.finalize()
         
-        file_name = audio_file.filename
-        file_path = os.path.join(pwd, "audio", file_name)
+        if not received:
+            raise UploadRejected(f"找不到檔案欄位 {field_name}")
         
-        print(f"📥 接收檔案: {file_name}")
+        # 依內容決定目錄：同名不同內容的上傳互不覆蓋，相同內容則沿用同一個 workspace
+        file_hash = hasher.hexdigest()
+        file_path = os.path.join(workspace_manager.audio_dir(file_hash[:16]), file_name)
+        # 分析端在 start() 時已開啟暫存檔，rename 後仍可繼續讀取
+        os.replace(tmp_path, file_path)
+        tmp_path = None
+        if detector is not None:
+            detector.close(file_path)
+            detector = None
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio_file.file, buffer)
+        UPLOAD_BYTES_RECEIVED.inc(size)
+        print(f"📥 已接收 {file_name}：{size / 1024 / 1024:.1f} MB，耗時 {time.time() - started_at:.1f} 秒（sha256 {file_hash[:12]}）")
+        return file_path, file_name, file_hash
+    
+    finally:
+        if out is not None:
+            await out.close()
+        if detector is not None:
+            await detector.abort()
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+async def wait_for_job(job: Job):
+    """等待工作結束；排隊中被取消的工作其 future 會被 cancel，不當成本請求被取消"""
+    try:
+        await asyncio.wrap_future(job.future)
+    except asyncio.CancelledError:
+        if not job.future.cancelled():
+            # 用戶端斷線等情況，請求本身被取消
+            raise
+
+def job_error_response(job: Job) -> JSONResponse:
+    """已結束但未成功的工作：取消回傳 409，失敗回傳 500"""
+    status_code = 409 if job.status == "cancelled" else 500
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "status": "error",
+            "message": job.error or f"工作狀態: {job.status}",
+            "final_summary": ""
+        }
+    )
+
+async def submit_upload(request: Request) -> Job:
+    """接收上傳並建立工作；上傳期間佇列被排滿時刪除剛收下的音檔，不留到 TTL 才回收"""
+    job_manager.check_capacity()
+    file_path, file_name, file_hash = await ingest_upload(request)
+    try:
+        return job_manager.submit("audio", file_name, process_audio_file, file_path, file_name, dedup_key=file_hash)
+    except JobQueueFull:
+        workspace_manager.discard(workspace_manager.key_for(file_path, file_name))
+        raise
+
+@fastapi_app.post("/process_audio/")
+async def process_audio(request: Request):
+    """處理上傳的音頻檔案（multipart 欄位 audio_file；在背景工作中執行，等待完成後回傳結果）"""
+    try:
+        job = await submit_upload(request)
+        await wait_for_job(job)
         
-        result = process_audio_file(file_path, file_name)
-        return JSONResponse(content=result)
+        if job.status == "cancelled":
+            return job_error_response(job)
+        if job.status != "succeeded":
+            raise Exception(job.error or f"工作狀態: {job.status}")
+        return JSONResponse(content=job.result)
         
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    except JobQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
         error_msg = str(e)
         print(f"❌ 處理失敗: {error_msg}")
@@ -544,21 +3029,24 @@ async def process_audio(audio_file: UploadFile = File(...)):
 
 @fastapi_app.post("/process_youtube/")
 async def process_youtube(request: YouTubeRequest):
-    """處理 YouTube 影片網址，下載音訊並處理"""
+    """處理 YouTube 影片網址，下載音訊並處理（在背景工作中執行）"""
     try:
         youtube_url = request.url
         print(f"📺 接收 YouTube 網址: {youtube_url}")
         
-        # 下載 YouTube 音訊
-        file_path, file_name = download_youtube_audio(youtube_url)
-        
-        # 使用相同的處理邏輯
-        result = process_audio_file(file_path, file_name)
-        result["source"] = "youtube"
-        result["youtube_url"] = youtube_url
+        job = job_manager.submit(
+            "youtube", youtube_url, process_youtube_url, youtube_url, dedup_key=youtube_dedup_key(youtube_url)
+        )
+        await wait_for_job(job)
         
-        return JSONResponse(content=result)
+        if job.status == "cancelled":
+            return job_error_response(job)
+        if job.status != "succeeded":
+            raise Exception(job.error or f"工作狀態: {job.status}")
+        return JSONResponse(content=job.result)
         
+    except JobQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
         error_msg = str(e)
         print(f"❌ YouTube 處理失敗: {error_msg}")
@@ -571,6 +3059,89 @@ async def process_youtube(request: YouTubeRequest):
             }
         )
 
+@fastapi_app.post("/jobs/audio", status_code=202)
+async def submit_audio_job(request: Request):
+    """上傳音頻檔案（multipart 欄位 audio_file）並建立背景工作，立即回傳 job_id"""
+    try:
+        job = await submit_upload(request)
+        return job.to_dict()
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    except JobQueueFull as e:
+        return queue_full_response(e)
+
+@fastapi_app.post("/jobs/youtube", status_code=202)
+async def submit_youtube_job(request: YouTubeRequest):
+    """建立 YouTube 背景工作，立即回傳 job_id"""
+    try:
+        job = job_manager.submit(
+            "youtube", request.url, process_youtube_url, request.url, dedup_key=youtube_dedup_key(request.url)
+        )
+        return job.to_dict()
+    except JobQueueFull as e:
+        return queue_full_response(e)
+
+@fastapi_app.post("/process_audio/stream")
+async def process_audio_stream(request: Request):
+    """上傳音頻檔案並以 SSE 串流回傳處理進度、各切片結果與逐段產生的最終摘要"""
+    try:
+        job = await submit_upload(request)
+        return sse_response(job, announce=True)
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    except JobQueueFull as e:
+        return queue_full_response(e)
+
+@fastapi_app.post("/process_youtube/stream")
+async def process_youtube_stream(request: YouTubeRequest):
+    """處理 YouTube 影片網址，以 SSE 串流回傳處理進度"""
+    try:
+        print(f"📺 接收 YouTube 網址: {request.url}")
+        job = job_manager.submit(
+            "youtube", request.url, process_youtube_url, request.url, dedup_key=youtube_dedup_key(request.url)
+        )
+        return sse_response(job, announce=True)
+    except JobQueueFull as e:
+        return queue_full_response(e)
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到工作 {job_id}")
+    return job
+
+@fastapi_app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """查詢工作狀態"""
+    return get_job_or_404(job_id).to_dict()
+
+@fastapi_app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """取得工作結果；尚未完成時回傳 202"""
+    job = get_job_or_404(job_id)
+    
+    if job.status == "succeeded":
+        return JSONResponse(content=job.result)
+    if not job.finished:
+        return JSONResponse(status_code=202, content=job.to_dict())
+    
+    return job_error_response(job)
+
+@fastapi_app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str, last_event_id: Optional[int] = None,
+                         last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """以 SSE 訂閱工作事件；斷線後帶 Last-Event-ID 重新連線即可從中斷處接續，不必重新建立工作"""
+    job = get_job_or_404(job_id)
+    if last_event_id is None:
+        last_event_id = int(last_event_id_header) if last_event_id_header and last_event_id_header.isdigit() else -1
+    return sse_response(job, last_event_id)
+
+@fastapi_app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """取消排隊中或執行中的工作"""
+    get_job_or_404(job_id)
+    return job_manager.cancel(job_id).to_dict()
+
 @fastapi_app.get("/")
 async def root():
     """API 根路徑"""
@@ -579,14 +3150,28 @@ async def root():
         "version": "2.0",
         "endpoints": {
             "/process_audio/": "POST - 上傳音頻檔案進行處理",
-            "/process_youtube/": "POST - 處理 YouTube 影片網址"
+            "/process_youtube/": "POST - 處理 YouTube 影片網址",
+            "/process_audio/stream": "POST - 上傳音頻檔案，以 SSE 串流回傳進度與結果",
+            "/process_youtube/stream": "POST - 處理 YouTube 影片網址，以 SSE 串流回傳進度與結果",
+            "/jobs/audio": "POST - 上傳音頻檔案，建立背景工作",
+            "/jobs/youtube": "POST - 建立 YouTube 背景工作",
+            "/jobs/{job_id}": "GET - 查詢工作狀態",
+            "/jobs/{job_id}/result": "GET - 取得工作結果",
+            "/jobs/{job_id}/events": "GET - 以 SSE 訂閱工作事件（支援 Last-Event-ID 續傳）",
+            "/jobs/{job_id}/cancel": "POST - 取消工作",
+            "/metrics": "GET - Prometheus 監控指標"
         }
     }
 
+@fastapi_app.get("/metrics")
+async def metrics():
+    """Prometheus 格式的監控指標"""
+    return Response(content=generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
 @fastapi_app.get("/health")
 async def health_check():
-    """健康檢查端點"""
-    return {"status": "healthy"}
+    """健康檢查端點（不載入任何大型套件，warmup 為預熱狀態）"""
+    return {"status": "healthy", "warmup": warmup_status}
 
 # 啟動伺服器的指令:
-# uvicorn main:fastapi_app --reload
\ No newline at end of file
+# uvicorn main:fastapi_app --reload